@@ -9,35 +9,62 @@
 
 from pypy.rlib.streamio import open_file_as_stream
 
-from barla.interpreter import Interpreter
-from barla.objects import Code
-from barla.parsing import RePattern, statements
-
-
-class BarlaSyntaxError(Exception):
-    pass
+from barla import opcodes
+from barla.assembler import Assembler
+from barla.builtins import b_None
+from barla.cache import read_cache, write_cache
+from barla.interpreter import BarlaNameError, Interpreter
+from barla.parsing import (BarlaSyntaxError, ParseState, RePattern,
+                           next_statement)
 
 
 whitespaces = RePattern('\s*')
-def compile(filename):
+def compile(filename, dump=True, optimize=True, use_cache=True):
     f = open_file_as_stream(filename)
     source = f.readall()
     f.close()
+    if not use_cache:
+        return compile_source(source, dump, optimize)
 
-    result = statements.match(source)
-    # Remove trailing whitespaces
-    match = whitespaces.match(result.rest)
-    if match:
-        result.rest = result.rest[match.end():]
-    if result.rest:
-        raise BarlaSyntaxError(result.rest)
+    # A cache hit has no parse tree to dump, so dumping parses the source
+    code = None
+    if not dump:
+        code = read_cache(filename, source, optimize)
+    if code is None:
+        code = compile_source(source, dump, optimize)
+        write_cache(filename, source, optimize, code)
+    return code
 
-    print 'Parse tree:'
-    result.tree.dump()
+def compile_source(source, dump=True, optimize=True):
+    """
+        Compiles `source` one top-level statement at a time, so neither
+        the parser's memo table nor the parse tree of the whole program
+        has to be kept.
+    """
+    if dump:
+        print 'Parse tree:'
+    state = ParseState(source)
+    asm = Assembler('<module>', None, 0, optimize)
+    pos = 0
+    while True:
+        result = next_statement(state, pos)
+        if result is None:
+            break
+        pos = result.pos
+        if dump:
+            result.tree.dump(4)
+        result.tree.compile(asm)
+    # Skip trailing whitespaces
+    match = whitespaces.match(source, pos)
+    if match:
+        pos = match.end()
+    if pos < len(source):
+        end = source.find('\n', pos)
+        if end < 0:
+            end = len(source)
+        raise BarlaSyntaxError('invalid syntax: %s' % (source[pos:end], ))
 
-    bytecode = []
-    consts = []
-    for stmt in result.tree.children:
-        stmt.compile(bytecode, consts)
+    asm.emit(opcodes.LOAD_CONST, asm.add_const(b_None))
+    asm.emit(opcodes.RETURN)
 
-    return Code(''.join(bytecode), consts)
+    return asm.assemble()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.assembler
+    ~~~~~~~~~~~~~~~
+
+    Turns a list of instructions into a code object. Jump targets are
+    symbolic labels until the very end, so operands can have any width.
+"""
+
+from barla import opcodes
+from barla.dis import verify
+from barla.objects import Bool, Code, Int, Long, None_, Str
+from barla.optimizer import optimize
+
+
+class Label(object):
+    """
+        A jump target. `index` is the index of the instruction the label
+        points to.
+    """
+    def __init__(self):
+        self.index = -1
+
+class Instruction(object):
+    def __init__(self, opcode, arg=0, label=None):
+        self.opcode = opcode
+        self.arg = arg
+        self.label = label
+
+    def size(self):
+        """
+            Returns the number of bytes this instruction needs.
+        """
+        if self.opcode < opcodes.HAVE_ARGUMENT:
+            return 1
+        size = 2
+        arg = self.arg >> 8
+        while arg:
+            size += 2
+            arg >>= 8
+        return size
+
+    def encode(self, code):
+        if self.opcode < opcodes.HAVE_ARGUMENT:
+            code.append(chr(self.opcode))
+            return
+        shift = 0
+        while self.arg >> (shift + 8):
+            shift += 8
+        while shift:
+            code.append(chr(opcodes.EXTENDED_ARG))
+            code.append(chr((self.arg >> shift) & 0xff))
+            shift -= 8
+        code.append(chr(self.opcode))
+        code.append(chr(self.arg & 0xff))
+
+def const_key(obj):
+    """
+        Returns the key under which the constant `obj` is interned: its
+        type tag followed by its value, as in the serialized form. Code
+        objects are never shared and have no key.
+    """
+    if isinstance(obj, Int):
+        return 'i' + str(obj.intvalue)
+    elif isinstance(obj, Long):
+        return 'l' + obj.longvalue.str()
+    elif isinstance(obj, Str):
+        return 's' + obj.flatten()
+    elif isinstance(obj, Bool):
+        return 'T' if obj.boolvalue else 'F'
+    elif isinstance(obj, None_):
+        return 'N'
+    return None
+
+class Assembler(object):
+    def __init__(self, name, varnames=None, argcount=0, optimize=True):
+        self.name = name
+        self.instructions = []
+        self.consts = []
+        # Interned constants, see `const_key`
+        self.const_indexes = {}
+        self.names = []
+        self.name_indexes = {}
+        # Local variables get numbered slots, everything else is global
+        if varnames is None:
+            varnames = []
+        self.varnames = varnames
+        self.slots = {}
+        for (i, name) in enumerate(varnames):
+            self.slots[name] = i
+        # The first `argcount` locals are the parameters
+        self.argcount = argcount
+        # The name a nested function refers to itself by, see LOAD_SELF
+        self.self_name = None
+        # The locals of the enclosing functions, which a nested function
+        # can't see
+        self.enclosing_names = []
+        # Run the peephole optimizer before assembling
+        self.optimize = optimize
+
+    def emit(self, opcode, arg=0):
+        assert arg >= 0
+        self.instructions.append(Instruction(opcode, arg))
+
+    def emit_jump(self, opcode, label):
+        self.instructions.append(Instruction(opcode, 0, label))
+
+    def new_label(self):
+        return Label()
+
+    def set_label(self, label):
+        label.index = len(self.instructions)
+
+    def add_const(self, obj):
+        """
+            Returns the index of a constant equal to `obj`, adding `obj` to
+            the constants if there is none yet.
+        """
+        key = const_key(obj)
+        if key is not None:
+            try:
+                return self.const_indexes[key]
+            except KeyError:
+                pass
+        index = len(self.consts)
+        self.consts.append(obj)
+        if key is not None:
+            self.const_indexes[key] = index
+        return index
+
+    def add_name(self, name):
+        """
+            Returns the index of the global `name` in the names.
+        """
+        try:
+            return self.name_indexes[name]
+        except KeyError:
+            index = len(self.names)
+            self.names.append(name)
+            self.name_indexes[name] = index
+            return index
+
+    def local_slot(self, name):
+        """
+            Returns the slot of the local variable `name`, or -1 if `name`
+            is global.
+        """
+        return self.slots.get(name, -1)
+
+    def assemble(self):
+        """
+            Resolves the labels and returns the verified code object.
+        """
+        if self.optimize:
+            optimize(self)
+        instructions = self.instructions
+        # Bit 1: code contains an absolute jump (a loop or an else branch)
+        # Bit 2: code loads the global named like itself or its own
+        # function (recursion)
+        flags = 0
+        for instr in instructions:
+            if instr.opcode == opcodes.JUMP_ABSOLUTE:
+                flags |= 1
+            elif (instr.opcode == opcodes.LOAD_GLOBAL and
+                  self.names[instr.arg] == self.name):
+                flags |= 2
+            elif instr.opcode == opcodes.LOAD_SELF:
+                flags |= 2
+        # Start with the smallest possible jump operands and widen them
+        # until all jump targets fit. Instructions only ever grow, so
+        # this terminates.
+        offsets = [0] * (len(instructions) + 1)
+        changed = True
+        while changed:
+            pos = 0
+            for (i, instr) in enumerate(instructions):
+                offsets[i] = pos
+                pos += instr.size()
+            offsets[len(instructions)] = pos
+            changed = False
+            for instr in instructions:
+                if instr.label is not None:
+                    assert instr.label.index >= 0
+                    target = offsets[instr.label.index]
+                    if target != instr.arg:
+                        instr.arg = target
+                        changed = True
+        code = []
+        for instr in instructions:
+            instr.encode(code)
+        code = Code(self.name, ''.join(code), self.consts, self.names,
+                    self.varnames, self.argcount, flags)
+        verify(code)
+        return code
@@ -7,7 +7,7 @@
     Builtin functions of barla.
 """
 
-from barla.objects import BuiltinFunction, Int, None_
+from barla.objects import BuiltinFunction, Int, List, None_
 
 
 builtins = {}
@@ -21,5 +21,25 @@ def b_str(args):
 builtins['str'] = b_str
 
 
+@BuiltinFunction
+def b_len(args):
+    if len(args) != 1:
+        raise TypeError('len expects one argument')
+    return args[0].len()
+builtins['len'] = b_len
+
+
+@BuiltinFunction
+def b_append(args):
+    if len(args) != 2:
+        raise TypeError('append expects two arguments')
+    lst = args[0]
+    if not isinstance(lst, List):
+        raise TypeError('can only append to lists')
+    lst.append(args[1])
+    return b_None
+builtins['append'] = b_append
+
+
 b_None = None_()
 builtins['None'] = b_None
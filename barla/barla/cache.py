@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.cache
+    ~~~~~~~~~~~
+
+    The compiled bytecode cache. The code object for `foo.bl` is stored in
+    `foo.O.blc`, or in `foo.blc` if it was compiled without the peephole
+    optimizer, together with the MD5 of the source it was compiled from.
+    Runs with and without the optimizer thus don't overwrite each other's
+    cache.
+"""
+
+from pypy.rlib.rmd5 import RMD5
+from pypy.rlib.streamio import open_file_as_stream
+
+from barla.serialize import FormatError, dump, load
+
+
+# Bump this whenever the bytecode or the serialization format changes
+VERSION = 9
+
+
+def cache_filename(filename, optimize):
+    if filename.endswith('.bl'):
+        end = len(filename) - len('.bl')
+        assert end >= 0
+        filename = filename[:end]
+    if optimize:
+        return filename + '.O.blc'
+    return filename + '.blc'
+
+def header(source, optimize):
+    """
+        Identifies the source and the compiler settings a cache file is
+        valid for.
+    """
+    return 'BLC%d;%s;%d;' % (VERSION, RMD5(source).hexdigest(),
+                             int(optimize))
+
+def read_cache(filename, source, optimize):
+    """
+        Returns the cached code object for `source`, or None if there is
+        none or it is stale.
+    """
+    try:
+        f = open_file_as_stream(cache_filename(filename, optimize))
+        try:
+            data = f.readall()
+        finally:
+            f.close()
+    except OSError:
+        return None
+    expected = header(source, optimize)
+    if not data.startswith(expected):
+        return None
+    try:
+        return load(data[len(expected):])
+    except FormatError:
+        return None
+
+def write_cache(filename, source, optimize, code):
+    """
+        Writes the cache file for `source`. Failing to write it is not an
+        error, the code is simply compiled again next time.
+    """
+    data = header(source, optimize) + dump(code)
+    try:
+        f = open_file_as_stream(cache_filename(filename, optimize), 'w')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+    except OSError:
+        pass
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.dis
+    ~~~~~~~~~
+
+    Bytecode verifier and disassembler.
+
+    The verifier walks every path through a code object, checks operands
+    and jump targets and computes the maximum depth of the value stack,
+    which the VM uses to preallocate the stack of each frame.
+"""
+
+from barla import opcodes
+from barla.objects import Code, Str
+
+
+class VerifyError(Exception):
+    def __init__(self, code, pc, message):
+        self.code = code
+        self.pc = pc
+        self.message = message
+
+    def __str__(self):
+        return '%s at pc %d: %s' % (self.code.name, self.pc, self.message)
+
+
+def decode(bytecode, pc):
+    """
+        Returns the opcode and the operand of the instruction starting at
+        `pc`, and the pc of the next instruction. EXTENDED_ARG prefixes are
+        folded into the operand.
+    """
+    start = pc
+    if pc >= len(bytecode):
+        raise IndexError
+    opcode = ord(bytecode[pc])
+    pc += 1
+    arg = 0
+    if opcode >= opcodes.HAVE_ARGUMENT:
+        if pc >= len(bytecode):
+            raise IndexError
+        arg = ord(bytecode[pc])
+        pc += 1
+        while opcode == opcodes.EXTENDED_ARG:
+            if pc + 1 >= len(bytecode):
+                raise IndexError
+            opcode = ord(bytecode[pc])
+            arg = (arg << 8) | ord(bytecode[pc + 1])
+            pc += 2
+        if opcode < opcodes.HAVE_ARGUMENT:
+            raise IndexError
+    assert pc > start
+    return (opcode, arg, pc)
+
+def stack_effect(opcode, arg):
+    """
+        Returns how many values the instruction pops from the value stack
+        and how many it pushes.
+    """
+    if opcode in opcodes.BINARY_OPS:
+        return (2, 1)
+    elif opcode in opcodes.COMPARE_JUMPS.values():
+        return (2, 0)
+    elif opcode == opcodes.CALL:
+        # The function and its arguments, replaced by the result
+        return (arg + 1, 1)
+    elif opcode == opcodes.TAIL_CALL:
+        # Like RETURN, it leaves the frame
+        return (arg + 1, 0)
+    elif opcode == opcodes.BUILD_LIST:
+        return (arg, 1)
+    elif opcode == opcodes.BUILD_DICT:
+        return (2 * arg, 1)
+    elif opcode == opcodes.FOR_ITER:
+        # Keeps the iterator and pushes the next item. When it jumps, it
+        # pops the iterator instead (see `verify`).
+        return (1, 2)
+    elif opcode == opcodes.SET_ITEM:
+        return (3, 0)
+    elif opcode == opcodes.GET_ITEM:
+        return (2, 1)
+    elif opcode == opcodes.GET_ITER:
+        return (1, 1)
+    elif opcode in [opcodes.LOAD_CONST, opcodes.LOAD_FAST,
+                    opcodes.LOAD_GLOBAL, opcodes.MAKE_FUNCTION,
+                    opcodes.LOAD_SELF]:
+        return (0, 1)
+    elif opcode in [opcodes.PRINT, opcodes.RETURN, opcodes.POP_TOP,
+                    opcodes.STORE_FAST, opcodes.STORE_GLOBAL,
+                    opcodes.JUMP_IF_FALSE, opcodes.JUMP_IF_TRUE]:
+        return (1, 0)
+    return (0, 0)
+
+def check_operand(code, pc, opcode, arg):
+    if opcode not in opcodes.opcodes or opcode == opcodes.EXTENDED_ARG:
+        raise VerifyError(code, pc, 'unknown opcode %d' % (opcode, ))
+    if opcode in [opcodes.LOAD_CONST, opcodes.MAKE_FUNCTION]:
+        if arg >= len(code.consts):
+            raise VerifyError(code, pc, 'constant index out of range')
+        if (opcode == opcodes.MAKE_FUNCTION and
+            not isinstance(code.consts[arg], Code)):
+            raise VerifyError(code, pc, 'code constant expected')
+    elif opcode in [opcodes.LOAD_FAST, opcodes.STORE_FAST]:
+        if arg >= code.nlocals:
+            raise VerifyError(code, pc, 'local slot out of range')
+    elif opcode in [opcodes.LOAD_GLOBAL, opcodes.STORE_GLOBAL]:
+        if arg >= len(code.names):
+            raise VerifyError(code, pc, 'name index out of range')
+
+def instruction_starts(code):
+    """
+        Returns a list telling for every byte of `code` whether an
+        instruction starts there, and checks the instructions' operands.
+    """
+    bytecode = code.code
+    starts = [False] * len(bytecode)
+    pc = 0
+    while pc < len(bytecode):
+        starts[pc] = True
+        try:
+            (opcode, arg, next_pc) = decode(bytecode, pc)
+        except IndexError:
+            raise VerifyError(code, pc, 'truncated instruction')
+        check_operand(code, pc, opcode, arg)
+        pc = next_pc
+    return starts
+
+def verify(code):
+    """
+        Verifies `code` and sets its `stacksize`. Every path must end in a
+        RETURN or TAIL_CALL; values below the return value (or the function
+        and its arguments), like the iterators of the loops a return leaves,
+        are dropped with the frame. Jumps must land on instructions and all
+        paths to an instruction must agree on the stack depth. Raises
+        VerifyError otherwise.
+    """
+    bytecode = code.code
+    if not bytecode:
+        raise VerifyError(code, 0, 'empty code')
+    starts = instruction_starts(code)
+    # Stack depth before each instruction, -1 if not reached yet
+    depths = [-1] * len(bytecode)
+    depths[0] = 0
+    pending = [0]
+    stacksize = 0
+    while pending:
+        pc = pending.pop()
+        depth = depths[pc]
+        (opcode, arg, next_pc) = decode(bytecode, pc)
+        (pops, pushes) = stack_effect(opcode, arg)
+        if depth < pops:
+            raise VerifyError(code, pc, 'stack underflow')
+        stacksize = max(stacksize, depth - pops + pushes)
+        if opcode in [opcodes.RETURN, opcodes.TAIL_CALL]:
+            continue
+        jump_depth = depth - pops + pushes
+        if opcode == opcodes.FOR_ITER:
+            jump_depth = depth - 1
+        depth = depth - pops + pushes
+        if opcode in opcodes.JUMPS:
+            if arg >= len(bytecode) or not starts[arg]:
+                raise VerifyError(code, pc, 'invalid jump target %d' % (arg, ))
+            merge(code, depths, pending, pc, arg, jump_depth)
+        if opcode != opcodes.JUMP_ABSOLUTE:
+            if next_pc >= len(bytecode):
+                raise VerifyError(code, pc, 'falls off the end of the code')
+            merge(code, depths, pending, pc, next_pc, depth)
+    code.stacksize = stacksize
+
+def merge(code, depths, pending, pc, target, depth):
+    if depths[target] < 0:
+        depths[target] = depth
+        pending.append(target)
+    elif depths[target] != depth:
+        raise VerifyError(code, pc, 'stack depth %d at %d, expected %d' % (
+            depth, target, depths[target]))
+
+
+def const_repr(const):
+    if isinstance(const, Str):
+        return "'%s'" % (const.flatten(), )
+    elif isinstance(const, Code):
+        return '<code %s>' % (const.name, )
+    return const.str().flatten()
+
+def operand_repr(code, opcode, arg):
+    if opcode in [opcodes.LOAD_CONST, opcodes.MAKE_FUNCTION]:
+        return const_repr(code.consts[arg])
+    elif opcode in [opcodes.LOAD_FAST, opcodes.STORE_FAST]:
+        return code.varnames[arg]
+    elif opcode in [opcodes.LOAD_GLOBAL, opcodes.STORE_GLOBAL]:
+        return code.names[arg]
+    elif opcode in opcodes.JUMPS:
+        return 'to %d' % (arg, )
+    return ''
+
+def dis(code):
+    """
+        Prints the instructions of `code` and of the functions defined in
+        it. Jump targets are marked with '>>'.
+    """
+    print 'Code %s: %d arguments, %d locals, stack size %d' % (
+        code.name, code.argcount, code.nlocals, code.stacksize)
+    bytecode = code.code
+    targets = [False] * (len(bytecode) + 1)
+    pc = 0
+    while pc < len(bytecode):
+        (opcode, arg, pc) = decode(bytecode, pc)
+        if opcode in opcodes.JUMPS and arg <= len(bytecode):
+            targets[arg] = True
+    pc = 0
+    while pc < len(bytecode):
+        start = pc
+        (opcode, arg, pc) = decode(bytecode, pc)
+        marker = '>>' if targets[start] else ''
+        if opcode >= opcodes.HAVE_ARGUMENT:
+            operand = str(arg)
+            detail = operand_repr(code, opcode, arg)
+            if detail:
+                operand += ' (%s)' % (detail, )
+        else:
+            operand = ''
+        print '%2s %6d %-16s %s' % (marker, start, opcodes.opcodes[opcode],
+                                    operand)
+    print
+    for const in code.consts:
+        if isinstance(const, Code):
+            dis(const)
@@ -9,145 +9,575 @@
 
 
 from pypy.rlib.jit import JitDriver
+from pypy.rlib.unroll import unrolling_iterable
 
 from barla import opcodes
 from barla.builtins import builtins
-from barla.objects import Function
+from barla.objects import (Dict, Function, Int, Iterator, List, newbool,
+                           newint)
 
 
 def can_inline(code, counter):
     """
     This function gets called with the green args as arguments and
-    returns whether can_enter_jit will be hit or not.
+    returns whether can_enter_jit will be hit or not. Recursive functions
+    hit it at their entry, so they are not inlined either.
     """
     return not code.flags
 
 jitdriver = JitDriver(can_inline=can_inline,
                       greens=['code', 'pc'],
-                      reds=['frame', 'consts', 'interpreter', 'stack',
-                            'with_jit'])
+                      reds=['frame', 'oldframe', 'interpreter', 'with_jit'])
+
+# Maximum number of frames kept for reuse
+FRAME_POOL_SIZE = 64
+
+
+class BarlaNameError(Exception):
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return "name '%s' is not defined" % (self.name, )
+
+
+class Cell(object):
+    """
+        Holds the value of a global variable. Inline caches keep the cell
+        instead of the value, so rebinding the global is seen by every
+        cache without invalidating it.
+    """
+    def __init__(self, name):
+        self.name = name
+        # None while the global is unbound
+        self.value = None
+
+
+class InlineCache(object):
+    """
+        What an instruction learned the last time it was executed.
+    """
+    def __init__(self):
+        # LOAD_GLOBAL and STORE_GLOBAL: the cell of the global
+        self.cell = None
+        # CALL: the function last called here, its arity matched
+        self.function = None
 
 
 class Frame(object):
-    def __init__(self, code, prev=None, jitted=False):
+    def __init__(self, code, back):
+        self.code = code
+        self.locals = [None] * code.nlocals
+        # The value stack, sized by the verifier, and its first free slot
+        self.stack = [None] * code.stacksize
+        self.sp = 0
+        # The calling frame, or None for the frame `execute` started with
+        self.back = back
+        # Where to continue in this frame after a call returns
+        self.pc = 0
+        self.retval = None
+
+    def reset(self, code, back):
+        """
+            Prepares a pooled frame for its next use.
+        """
         self.code = code
-        self.locals = {}
-        self.next = None
-        self.prev = prev
-        self.jitted = jitted
+        if len(self.locals) == code.nlocals:
+            for i in xrange(code.nlocals):
+                self.locals[i] = None
+        else:
+            self.locals = [None] * code.nlocals
+        if len(self.stack) == code.stacksize:
+            for i in xrange(self.sp):
+                self.stack[i] = None
+        else:
+            self.stack = [None] * code.stacksize
+        self.sp = 0
+        self.back = back
+        self.pc = 0
+        self.retval = None
+
+    def push(self, obj):
+        self.stack[self.sp] = obj
+        self.sp += 1
+
+    def top(self):
+        sp = self.sp - 1
+        assert sp >= 0
+        return self.stack[sp]
+
+    def pop(self):
+        sp = self.sp - 1
+        assert sp >= 0
+        obj = self.stack[sp]
+        self.stack[sp] = None
+        self.sp = sp
+        return obj
 
 
 class Interpreter(object):
     def __init__(self):
         self.frame = None
-        self.stack = []
+        # Maps names to their cells
+        self.globals = {}
+        self.free_frames = []
+        # Do Int-op-Int comparisons on the machine words instead of
+        # through the object methods. Arithmetic always goes through
+        # Int.add, sub and mul, which have their own fast path.
+        self.int_fast_path = True
+        # Remember resolved globals and callees per instruction
+        self.use_inline_caches = True
+        # A barla.profiler.Profiler, if the VM should be instrumented
+        self.profiler = None
+        # A barla.jitstats.JitStats, if JIT statistics should be gathered
+        self.jit_stats = None
+        # If not None, PRINT appends its lines here instead of writing
+        # them to stdout
+        self.output = None
+
+    def new_frame(self, code, back):
+        if self.free_frames:
+            frame = self.free_frames.pop()
+            frame.reset(code, back)
+            return frame
+        return Frame(code, back)
+
+    def free_frame(self, frame):
+        if len(self.free_frames) < FRAME_POOL_SIZE:
+            frame.back = None
+            self.free_frames.append(frame)
+
+    def reset_globals(self):
+        """
+            Unbinds all globals, so the next program starts from scratch.
+            The cells are kept, they may still be referenced by inline
+            caches.
+        """
+        for cell in self.globals.values():
+            cell.value = None
+
+    def abort(self):
+        """
+            Forgets the frames of a program that was stopped by an error,
+            so the next `execute` starts from a clean state.
+        """
+        self.frame = None
+
+    def global_cell(self, name):
+        try:
+            return self.globals[name]
+        except KeyError:
+            cell = Cell(name)
+            self.globals[name] = cell
+            return cell
+
+    def inline_cache(self, code, pc):
+        """
+            Returns the inline cache of the instruction before `pc`. The
+            caches of a code object are dropped when another interpreter
+            runs it, as they refer to the globals of one interpreter.
+        """
+        if code.cache_owner is not self:
+            code.inline_caches = [None] * (len(code.code) + 1)
+            code.cache_owner = self
+        cache = code.inline_caches[pc]
+        if cache is None:
+            cache = InlineCache()
+            code.inline_caches[pc] = cache
+        return cache
 
     def execute(self, code, with_jit=False):
-        # Setup new frame
-        self.frame, oldframe = Frame(code, self.frame, with_jit), self.frame
-        if oldframe is not None:
-            oldframe.next = self.frame
-        # Prepare dispatch loop
-        consts = code.consts
+        return self.run(Frame(code, None), with_jit)
+
+    def call_function(self, func, args):
+        """
+            Calls `func` from outside the dispatch loop.
+        """
+        frame = self.new_frame(func.func_code, None)
+        self.check_arguments(func.func_code, len(args))
+        for i in xrange(len(args)):
+            frame.locals[i] = args[i]
+        return self.run(frame, False)
+
+    def check_arguments(self, code, n_args):
+        if n_args != code.argcount:
+            raise TypeError('%d arguments expected, got %d' % (code.argcount,
+                                                               n_args))
+
+    def run(self, frame, with_jit):
+        """
+            Runs `frame` until it returns. Barla level calls and returns
+            switch frames inside the dispatch loop, so they don't use the
+            host stack.
+        """
+        oldframe = self.frame
+        self.frame = frame
+        code = frame.code
         pc = 0
-        frame = self.frame
-        stack = self.stack
+        if self.profiler is not None:
+            self.profiler.call(code)
         # The dispatch loop of barla's VM
-        while pc < len(code.code):
+        while 0 <= pc < len(code.code):
             if with_jit:
-                jitdriver.jit_merge_point(code=code, pc=pc,
-                                          consts=consts, frame=frame,
-                                          interpreter=self, stack=stack,
+                jitdriver.jit_merge_point(code=code, pc=pc, frame=frame,
+                                          oldframe=oldframe, interpreter=self,
                                           with_jit=with_jit)
-            stmt = code.code[pc]
+            start = pc
+            stmt = ord(code.code[pc])
             pc += 1
-
-            if stmt in [opcodes.ADD, opcodes.MUL, opcodes.SUB, opcodes.EQ,
-                        opcodes.NE, opcodes.LT, opcodes.LE, opcodes.GT,
-                        opcodes.GE]:
-                rhs = stack.pop()
-                lhs = stack.pop()
-
-                if stmt == opcodes.ADD:
-                    stack.append(lhs.add(rhs))
-                elif stmt == opcodes.MUL:
-                    stack.append(lhs.mul(rhs))
-                elif stmt == opcodes.SUB:
-                    stack.append(lhs.sub(rhs))
-                elif stmt == opcodes.EQ:
-                    stack.append(lhs.eq(rhs))
-                elif stmt == opcodes.NE:
-                    stack.append(lhs.ne(rhs))
-                elif stmt == opcodes.LT:
-                    stack.append(lhs.lt(rhs))
-                elif stmt == opcodes.LE:
-                    stack.append(lhs.le(rhs))
-                elif stmt == opcodes.GT:
-                    stack.append(lhs.gt(rhs))
-                elif stmt == opcodes.GE:
-                    stack.append(lhs.ge(rhs))
-            elif stmt == opcodes.JUMP_ABSOLUTE:
-                target = ord(code.code[pc])
-                if with_jit and target < pc:
-                    jitdriver.can_enter_jit(code=code, pc=target,
-                                            consts=consts, frame=frame,
-                                            interpreter=self, stack=stack,
-                                            with_jit=with_jit)
-                pc = target
-                continue
-            elif stmt == opcodes.JUMP_IF_FALSE:
-                if not stack.pop().true().boolvalue:
-                    pc += ord(code.code[pc])
-                    continue
-                pc += 1
-            elif stmt == opcodes.JUMP_IF_TRUE:
-                if stack.pop().true().boolvalue:
-                    pc += ord(code.code[pc])
-                    continue
-                pc += 1
-            elif stmt == opcodes.LOAD_CONST:
-                index = ord(code.code[pc])
-                pc += 1
-                stack.append(consts[index])
-            elif stmt == opcodes.LOAD_NAME:
-                index = ord(code.code[pc])
-                pc += 1
-                # First, search the name in frame locals
-                name = consts[index].str().strvalue
-                try:
-                    obj = frame.locals[name]
-                except KeyError:
-                    # Search in parent frames
-                    pframe = frame.prev
-                    while pframe is not None:
-                        try:
-                            obj = pframe.locals[name]
-                        except KeyError:
-                            pframe = pframe.prev
-                        else:
-                            break
-                    else:
-                        # Then search in builtins
-                        obj = builtins[name]
-                stack.append(obj)
-            elif stmt == opcodes.STORE_NAME:
-                index = ord(code.code[pc])
+            if stmt >= opcodes.HAVE_ARGUMENT:
+                arg = ord(code.code[pc])
                 pc += 1
-                frame.locals[consts[index].str().strvalue] = stack.pop()
-            elif stmt == opcodes.CALL:
-                func = stack.pop()
-                n_args = ord(code.code[pc])
-                pc += 1
-                args = [stack.pop() for _ in xrange(n_args)]
-                stack.append(func.call(self, args))
-            elif stmt == opcodes.RETURN:
-                return stack.pop()
-            elif stmt == opcodes.PRINT:
-                print stack.pop().str().strvalue
-            elif stmt == opcodes.MAKE_FUNCTION:
-                index = ord(code.code[pc])
-                pc += 1
-                fcode = consts[index]
-                stack.append(Function(fcode))
+                while stmt == opcodes.EXTENDED_ARG:
+                    stmt = ord(code.code[pc])
+                    arg = (arg << 8) | ord(code.code[pc + 1])
+                    pc += 2
+            else:
+                arg = 0
+            if self.profiler is not None:
+                self.profiler.instruction(code, start, stmt)
+
+            # Dispatch to the handler method named like the opcode. The
+            # loop is unrolled, so this becomes a switch after translation.
+            for (opcode, name) in opcode_handlers:
+                if stmt == opcode:
+                    pc = getattr(self, name)(frame, pc, arg)
+                    break
             else:
-                raise RuntimeError('Unknown opcode: ' + str(ord(stmt)))
+                raise RuntimeError('Unknown opcode: ' + str(stmt))
+
+            # Backward jumps and the entries of recursive functions (flag
+            # bit 2) are where the JIT may start tracing, the latter so
+            # that recursion without loops gets traced as well. Other
+            # functions are inlined into their callers' traces.
+            header = False
+            if stmt == opcodes.CALL or stmt == opcodes.RETURN:
+                # Switch to the callee or back to the caller
+                if self.frame is not frame:
+                    frame = self.frame
+                    code = frame.code
+                    if stmt == opcodes.CALL:
+                        header = code.flags & 2 != 0
+                        if self.profiler is not None:
+                            self.profiler.call(code)
+            elif stmt == opcodes.TAIL_CALL:
+                # The frame now runs the callee from its start, or a
+                # builtin was called and the frame returned
+                frame = self.frame
+                code = frame.code
+                if pc == 0:
+                    header = code.flags & 2 != 0
+                    if self.profiler is not None:
+                        self.profiler.call(code)
+            elif stmt == opcodes.JUMP_ABSOLUTE and pc < start:
+                header = True
+            if with_jit and header:
+                if self.jit_stats is not None:
+                    self.jit_stats.reached(code, pc)
+                jitdriver.can_enter_jit(code=code, pc=pc, frame=frame,
+                                        oldframe=oldframe, interpreter=self,
+                                        with_jit=with_jit)
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.frame = oldframe
+        retval = frame.retval
+        frame.retval = None
+        return retval
+
+    # Opcode handlers. Each one gets the current frame, the pc of the next
+    # instruction and the operand, and returns the pc to continue at. A
+    # negative pc leaves the frame.
+
+    def ADD(self, frame, pc, arg):
+        rhs = frame.pop()
+        lhs = frame.pop()
+        frame.push(lhs.add(rhs))
+        return pc
+
+    def MUL(self, frame, pc, arg):
+        rhs = frame.pop()
+        lhs = frame.pop()
+        frame.push(lhs.mul(rhs))
+        return pc
+
+    def SUB(self, frame, pc, arg):
+        rhs = frame.pop()
+        lhs = frame.pop()
+        frame.push(lhs.sub(rhs))
+        return pc
+
+    def int_operands(self, lhs, rhs):
+        return (self.int_fast_path and isinstance(lhs, Int) and
+                isinstance(rhs, Int))
+
+    def compare(self, op, lhs, rhs):
+        """
+            Compares `lhs` and `rhs` with the comparison opcode `op` and
+            returns a Bool.
+        """
+        if self.int_operands(lhs, rhs):
+            return newbool(int_compare(op, lhs.intvalue, rhs.intvalue))
+        for (opcode, method, _) in comparisons:
+            if op == opcode:
+                return getattr(lhs, method)(rhs)
+        raise RuntimeError('Unknown comparison: ' + str(op))
+
+    def compare_top(self, frame, pc, op):
+        rhs = frame.pop()
+        lhs = frame.pop()
+        frame.push(self.compare(op, lhs, rhs))
+        return pc
+
+    def jump_if_not(self, frame, pc, arg, op):
+        """
+            A comparison fused with JUMP_IF_FALSE, which needs no Bool.
+        """
+        rhs = frame.pop()
+        lhs = frame.pop()
+        if self.int_operands(lhs, rhs):
+            result = int_compare(op, lhs.intvalue, rhs.intvalue)
+        else:
+            result = self.compare(op, lhs, rhs).boolvalue
+        if not result:
+            return arg
+        return pc
+
+    def EQ(self, frame, pc, arg):
+        return self.compare_top(frame, pc, opcodes.EQ)
+
+    def NE(self, frame, pc, arg):
+        return self.compare_top(frame, pc, opcodes.NE)
+
+    def LT(self, frame, pc, arg):
+        return self.compare_top(frame, pc, opcodes.LT)
+
+    def LE(self, frame, pc, arg):
+        return self.compare_top(frame, pc, opcodes.LE)
+
+    def GT(self, frame, pc, arg):
+        return self.compare_top(frame, pc, opcodes.GT)
+
+    def GE(self, frame, pc, arg):
+        return self.compare_top(frame, pc, opcodes.GE)
+
+    def JUMP_ABSOLUTE(self, frame, pc, arg):
+        return arg
+
+    def JUMP_IF_FALSE(self, frame, pc, arg):
+        if not frame.pop().is_true():
+            return arg
+        return pc
+
+    def JUMP_IF_TRUE(self, frame, pc, arg):
+        if frame.pop().is_true():
+            return arg
+        return pc
+
+    def JUMP_IF_NOT_EQ(self, frame, pc, arg):
+        return self.jump_if_not(frame, pc, arg, opcodes.EQ)
+
+    def JUMP_IF_NOT_NE(self, frame, pc, arg):
+        return self.jump_if_not(frame, pc, arg, opcodes.NE)
+
+    def JUMP_IF_NOT_LT(self, frame, pc, arg):
+        return self.jump_if_not(frame, pc, arg, opcodes.LT)
+
+    def JUMP_IF_NOT_LE(self, frame, pc, arg):
+        return self.jump_if_not(frame, pc, arg, opcodes.LE)
+
+    def JUMP_IF_NOT_GT(self, frame, pc, arg):
+        return self.jump_if_not(frame, pc, arg, opcodes.GT)
+
+    def JUMP_IF_NOT_GE(self, frame, pc, arg):
+        return self.jump_if_not(frame, pc, arg, opcodes.GE)
+
+    def POP_TOP(self, frame, pc, arg):
+        frame.pop()
+        return pc
+
+    def LOAD_CONST(self, frame, pc, arg):
+        frame.push(frame.code.consts[arg])
+        return pc
+
+    def LOAD_FAST(self, frame, pc, arg):
+        obj = frame.locals[arg]
+        if obj is None:
+            raise BarlaNameError(frame.code.varnames[arg])
+        frame.push(obj)
+        return pc
+
+    def STORE_FAST(self, frame, pc, arg):
+        frame.locals[arg] = frame.pop()
+        return pc
+
+    def LOAD_GLOBAL(self, frame, pc, arg):
+        # First, search the name in globals, then in builtins
+        cell = self.lookup_cell(frame, pc, arg)
+        obj = cell.value
+        if obj is None:
+            try:
+                obj = builtins[cell.name]
+            except KeyError:
+                raise BarlaNameError(cell.name)
+        frame.push(obj)
+        return pc
+
+    def STORE_GLOBAL(self, frame, pc, arg):
+        self.lookup_cell(frame, pc, arg).value = frame.pop()
+        return pc
+
+    def lookup_cell(self, frame, pc, arg):
+        if not self.use_inline_caches:
+            return self.global_cell(frame.code.names[arg])
+        cache = self.inline_cache(frame.code, pc)
+        if cache.cell is None:
+            cache.cell = self.global_cell(frame.code.names[arg])
+        return cache.cell
+
+    def CALL(self, frame, pc, arg):
+        func = frame.pop()
+        if isinstance(func, Function):
+            # Move the arguments straight into the callee's slots and
+            # continue in the callee
+            code = func.func_code
+            self.check_call(frame, pc, func, arg)
+            callee = self.new_frame(code, frame)
+            for i in xrange(arg):
+                callee.locals[i] = frame.pop()
+            frame.pc = pc
+            self.frame = callee
+            return 0
+        args = [frame.pop() for _ in xrange(arg)]
+        frame.push(func.call(self, args))
+        return pc
+
+    def TAIL_CALL(self, frame, pc, arg):
+        func = frame.pop()
+        if isinstance(func, Function):
+            # Replace the current frame's code and locals by the callee's,
+            # so the callee returns straight to our caller
+            code = func.func_code
+            self.check_call(frame, pc, func, arg)
+            args = [frame.pop() for _ in xrange(arg)]
+            frame.reset(code, frame.back)
+            for i in xrange(arg):
+                frame.locals[i] = args[i]
+            return 0
+        args = [frame.pop() for _ in xrange(arg)]
+        frame.push(func.call(self, args))
+        return self.RETURN(frame, pc, 0)
+
+    def check_call(self, frame, pc, func, arg):
+        if self.use_inline_caches:
+            # The arity only needs checking the first time a call site
+            # sees a function
+            cache = self.inline_cache(frame.code, pc)
+            if cache.function is not func:
+                self.check_arguments(func.func_code, arg)
+                cache.function = func
+        else:
+            self.check_arguments(func.func_code, arg)
+
+    def RETURN(self, frame, pc, arg):
+        retval = frame.pop()
+        if frame.back is None:
+            # Leave the dispatch loop
+            frame.retval = retval
+            return -1
+        caller = frame.back
+        self.free_frame(frame)
+        self.frame = caller
+        caller.push(retval)
+        return caller.pc
+
+    def GET_ITEM(self, frame, pc, arg):
+        index = frame.pop()
+        obj = frame.pop()
+        frame.push(obj.getitem(index))
+        return pc
+
+    def SET_ITEM(self, frame, pc, arg):
+        value = frame.pop()
+        index = frame.pop()
+        obj = frame.pop()
+        obj.setitem(index, value)
+        return pc
+
+    def GET_ITER(self, frame, pc, arg):
+        frame.push(frame.pop().iter())
+        return pc
+
+    def FOR_ITER(self, frame, pc, arg):
+        iterator = frame.top()
+        assert isinstance(iterator, Iterator)
+        item = iterator.next()
+        if item is None:
+            frame.pop()
+            return arg
+        frame.push(item)
+        return pc
+
+    def BUILD_LIST(self, frame, pc, arg):
+        items = [None] * arg
+        for i in xrange(arg - 1, -1, -1):
+            items[i] = frame.pop()
+        frame.push(List(items))
+        return pc
+
+    def BUILD_DICT(self, frame, pc, arg):
+        # Keys and values were pushed alternately
+        items = [None] * (2 * arg)
+        for i in xrange(2 * arg - 1, -1, -1):
+            items[i] = frame.pop()
+        result = Dict()
+        for i in xrange(arg):
+            result.setitem(items[2 * i], items[2 * i + 1])
+        frame.push(result)
+        return pc
+
+    def PRINT(self, frame, pc, arg):
+        line = frame.pop().str().flatten()
+        if self.output is not None:
+            self.output.append(line)
+        else:
+            print line
+        return pc
+
+    def MAKE_FUNCTION(self, frame, pc, arg):
+        frame.push(Function(frame.code.consts[arg]))
+        return pc
+
+    def LOAD_SELF(self, frame, pc, arg):
+        # Functions don't capture anything, so any function of the running
+        # code is as good as the one that was called
+        code = frame.code
+        if code.function is None:
+            code.function = Function(code)
+        frame.push(code.function)
+        return pc
+
+
+# The comparison opcodes, the Object method each one calls and what it
+# does on machine words
+comparisons = unrolling_iterable([
+    (opcodes.EQ, 'eq', lambda a, b: a == b),
+    (opcodes.NE, 'ne', lambda a, b: a != b),
+    (opcodes.LT, 'lt', lambda a, b: a < b),
+    (opcodes.LE, 'le', lambda a, b: a <= b),
+    (opcodes.GT, 'gt', lambda a, b: a > b),
+    (opcodes.GE, 'ge', lambda a, b: a >= b),
+])
+
+def int_compare(op, lhs, rhs):
+    """
+        Compares the machine words `lhs` and `rhs` with the comparison
+        opcode `op`.
+    """
+    for (opcode, _, compare) in comparisons:
+        if op == opcode:
+            return compare(lhs, rhs)
+    raise RuntimeError('Unknown comparison: ' + str(op))
+
+opcode_handlers = unrolling_iterable([(opcode, name) for (opcode, name)
+                                      in opcodes.opcodes.items()
+                                      if opcode != opcodes.EXTENDED_ARG])
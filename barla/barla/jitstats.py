@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.jitstats
+    ~~~~~~~~~~~~~~
+
+    Statistics about the JIT's entry points, gathered by the interpreter
+    at the places where it may enter compiled code: backward jumps and the
+    entries of recursive functions.
+
+    The JIT's own counters of traces, failed guards and bridges are not
+    reachable from the interpreter with this PyPy, so they are not
+    reported. What the interpreter can see is whether it reaches a header
+    while running compiled code, which means the header is part of a
+    compiled loop, and the switches between the two. A switch back to the
+    interpreter happens when a loop is left as well as when a guard fails
+    without a bridge; the two can't be told apart here.
+"""
+
+import time
+
+from pypy.rlib.jit import we_are_jitted
+
+
+class HeaderStats(object):
+    def __init__(self, code, pc):
+        self.code = code
+        self.pc = pc
+        # Times the header was reached by the interpreter and from
+        # compiled code
+        self.interpreted = 0
+        self.jitted = 0
+        # Times the interpreter reached the header before compiled code
+        # did for the first time
+        self.warmup = -1
+        # Switches between the interpreter and compiled code noticed here
+        self.entered = 0
+        self.left = 0
+
+
+class JitStats(object):
+    def __init__(self):
+        self.headers = {}
+        # All headers, in the order they were first reached
+        self.order = []
+        self.jitted = False
+        self.since = time.clock()
+        # Time spent interpreting and in compiled code
+        self.interpreter_time = 0.0
+        self.jitted_time = 0.0
+
+    def get_header(self, code, pc):
+        try:
+            headers = self.headers[code]
+        except KeyError:
+            headers = [None] * (len(code.code) + 1)
+            self.headers[code] = headers
+        header = headers[pc]
+        if header is None:
+            header = HeaderStats(code, pc)
+            headers[pc] = header
+            self.order.append(header)
+        return header
+
+    def reached(self, code, pc):
+        """
+            Called by the VM right before each `can_enter_jit`.
+        """
+        jitted = we_are_jitted()
+        now = time.clock()
+        if self.jitted:
+            self.jitted_time += now - self.since
+        else:
+            self.interpreter_time += now - self.since
+        self.since = now
+        header = self.get_header(code, pc)
+        if jitted:
+            header.jitted += 1
+            if header.warmup < 0:
+                header.warmup = header.interpreted
+            if not self.jitted:
+                header.entered += 1
+        else:
+            header.interpreted += 1
+            if self.jitted:
+                header.left += 1
+        self.jitted = jitted
+
+    def report(self):
+        compiled = 0
+        left = 0
+        print 'JIT entry point stats:'
+        print '%-24s %6s %12s %12s %8s %8s %10s' % (
+            'header', 'kind', 'interpreted', 'jitted', 'entered', 'left',
+            'warmup')
+        for header in self.order:
+            if header.warmup >= 0:
+                compiled += 1
+                warmup = str(header.warmup)
+            else:
+                warmup = '-'
+            left += header.left
+            print '%-24s %6s %12d %12d %8d %8d %10s' % (
+                '%s:%d' % (header.code.name, header.pc),
+                'entry' if header.pc == 0 else 'loop', header.interpreted,
+                header.jitted, header.entered, header.left, warmup)
+        print
+        print '%d of %d headers reached from compiled code' % (
+            compiled, len(self.order))
+        print ('%d switches from compiled code back to the interpreter '
+               '(loop exits or failed guards)' % (left, ))
+        print '%f seconds interpreting, %f seconds in compiled code' % (
+            self.interpreter_time, self.jitted_time)
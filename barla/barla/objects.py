@@ -7,22 +7,10 @@
     Barla's object model.
 """
 
+from pypy.rlib.objectmodel import compute_hash, compute_identity_hash, r_dict
 from pypy.rlib.rarithmetic import ovfcheck
 from pypy.rlib.rbigint import rbigint
-
-
-def generic_on(exc_type):
-    """NOT_RPYTHON"""
-    def decorator(method):
-        generic_method = getattr(Object, method.__name__)
-
-        def wrapper(self, other):
-            try:
-                return method(self, other)
-            except exc_type:
-                return generic_method(self.long(), other)
-        return wrapper
-    return decorator
+from pypy.rlib.rstring import StringBuilder
 
 
 class Object(object):
@@ -30,22 +18,24 @@ class Object(object):
         Base class for all objects.
     """
     def eq(self, other):
-        return Bool(self == other)
+        return newbool(self == other)
 
     def ne(self, other):
-        return Bool(self != other)
+        return newbool(self != other)
 
     def le(self, other):
-        return Bool(not self.gt(other).boolvalue)
+        return newbool(not self.gt(other).boolvalue)
 
     def lt(self, other):
-        return Bool(self.eq(other).boolvalue or self.le(other).boolvalue)
+        return newbool(self.eq(other).boolvalue or self.le(other).boolvalue)
 
     def ge(self, other):
-        return Bool(self.eq(other).boolvalue or not self.lt(other).boolvalue)
+        return newbool(self.eq(other).boolvalue or
+                       not self.lt(other).boolvalue)
 
     def gt(self, other):
-        return Bool(not(self.eq(other).boolvalue or self.lt(other).boolvalue))
+        return newbool(not(self.eq(other).boolvalue or
+                           self.lt(other).boolvalue))
 
     def add(self, other):
         raise TypeError()
@@ -59,9 +49,35 @@ class Object(object):
     def call(self, interpreter, args):
         raise TypeError('not callable')
 
+    def getitem(self, index):
+        raise TypeError('not subscriptable')
+
+    def setitem(self, index, value):
+        raise TypeError('does not support item assignment')
+
+    def len(self):
+        raise TypeError('has no length')
+
+    def iter(self):
+        raise TypeError('not iterable')
+
+    def hash(self):
+        """
+            Returns the hash used for dict keys. Objects that are equal
+            must have equal hashes.
+        """
+        return compute_identity_hash(self)
+
     def str(self):
         return Str('<Object>')
 
+    def repr(self):
+        """
+            Like `str`, but as a flat string and with strings quoted, for
+            showing objects inside of containers.
+        """
+        return self.str().flatten()
+
     def int(self):
         raise TypeError()
 
@@ -69,7 +85,13 @@ class Object(object):
         return Long(intvalue=self.int().intvalue)
 
     def true(self):
-        return Bool(True)
+        return TRUE
+
+    def is_true(self):
+        """
+            Like `true`, but returns an unboxed bool.
+        """
+        return self.true().boolvalue
 
 
 class Bool(Object):
@@ -82,6 +104,9 @@ class Bool(Object):
     def true(self):
         return self
 
+    def is_true(self):
+        return self.boolvalue
+
 
 class BuiltinFunction(Object):
     def __init__(self, func):
@@ -96,45 +121,54 @@ class Function(Object):
         self.func_code = code
 
     def call(self, interpreter, args):
-        interpreter.stack.extend(args)
-        return interpreter.execute(self.func_code,
-                                   interpreter.frame.jitted)
+        return interpreter.call_function(self, args)
 
     def str(self):
         return Str('<Function>')
 
 class Long(Object):
+    """
+        An integer that doesn't fit into a machine word. Arithmetic results
+        that fit are demoted to Int again (see `newlong`).
+    """
     def __init__(self, intvalue=0, longvalue=None):
         if longvalue is not None:
             self.longvalue = longvalue
         else:
             self.longvalue = rbigint.fromint(intvalue)
 
-    @generic_on(TypeError)
     def eq(self, other):
-        return Bool(self.longvalue == other.long().longvalue)
+        try:
+            return newbool(self.longvalue.eq(bigint(other)))
+        except TypeError:
+            return FALSE
 
-    @generic_on(TypeError)
     def ne(self, other):
-        return Bool(self.longvalue != other.long().longvalue)
-
-    def ge(self, other):
-        return self.lt(other)
+        return newbool(not self.eq(other).boolvalue)
 
     def lt(self, other):
-        return Bool(self.longvalue.lt(other.long().longvalue))
+        return newbool(self.longvalue.lt(bigint(other)))
+
+    def le(self, other):
+        return newbool(self.longvalue.le(bigint(other)))
+
+    def gt(self, other):
+        return newbool(self.longvalue.gt(bigint(other)))
+
+    def ge(self, other):
+        return newbool(self.longvalue.ge(bigint(other)))
 
     def add(self, other):
-        return Long(longvalue=self.longvalue.add(other.long().longvalue))
+        return newlong(self.longvalue.add(bigint(other)))
 
     def mul(self, other):
-        return Long(longvalue=self.longvalue.mul(other.long().longvalue))
+        return newlong(self.longvalue.mul(bigint(other)))
 
     def sub(self, other):
-        return Long(longvalue=self.longvalue.sub(other.long().longvalue))
+        return newlong(self.longvalue.sub(bigint(other)))
 
     def int(self):
-        raise OverflowError()
+        return newint(self.longvalue.toint())
 
     def long(self):
         return self
@@ -142,52 +176,87 @@ class Long(Object):
     def str(self):
         return Str(self.longvalue.str())
 
+    def hash(self):
+        return self.longvalue.hash()
+
     def true(self):
-        return Bool(self.longvalue.tobool())
+        return newbool(self.longvalue.tobool())
 
 
-def to_long_on_overflow(method):
-    """NOT_RPYTHON"""
-    long_method = getattr(Long, method.__name__)
+def bigint(obj):
+    """
+        Returns the value of an Int or Long as rbigint, without wrapping
+        Ints into a Long first. Raises TypeError for other objects.
+    """
+    if isinstance(obj, Int):
+        return rbigint.fromint(obj.intvalue)
+    elif isinstance(obj, Long):
+        return obj.longvalue
+    raise TypeError()
 
-    def wrapper(self, other):
-        try:
-            return method(self, other)
-        except OverflowError:
-            return long_method(self.long(), other)
-    return wrapper
+def newlong(value):
+    """
+        Wraps the rbigint `value`, into an Int if it fits.
+    """
+    try:
+        return newint(value.toint())
+    except OverflowError:
+        return Long(longvalue=value)
 
 
 class Int(Object):
+    """
+        A machine word integer. Operations overflowing it or involving a
+        Long are done on rbigints.
+    """
     def __init__(self, value):
         self.intvalue = value
 
-    @generic_on(TypeError)
     def eq(self, other):
-        return Bool(self.intvalue == other.int().intvalue)
+        if isinstance(other, Int):
+            return newbool(self.intvalue == other.intvalue)
+        elif isinstance(other, Long):
+            return newbool(rbigint.fromint(self.intvalue).eq(other.longvalue))
+        return FALSE
 
-    @generic_on(TypeError)
     def ne(self, other):
-        return Bool(self.intvalue != other.int().intvalue)
+        return newbool(not self.eq(other).boolvalue)
 
     def lt(self, other):
-        return Bool(self.intvalue < other.int().intvalue)
+        if isinstance(other, Int):
+            return newbool(self.intvalue < other.intvalue)
+        return newbool(rbigint.fromint(self.intvalue).lt(bigint(other)))
 
-    @to_long_on_overflow
     def add(self, other):
-        return Int(ovfcheck(self.intvalue + other.int().intvalue))
+        if isinstance(other, Int):
+            try:
+                return newint(ovfcheck(self.intvalue + other.intvalue))
+            except OverflowError:
+                pass
+        return newlong(rbigint.fromint(self.intvalue).add(bigint(other)))
 
-    @to_long_on_overflow
     def mul(self, other):
-        return Int(ovfcheck(self.intvalue * other.int().intvalue))
+        if isinstance(other, Int):
+            try:
+                return newint(ovfcheck(self.intvalue * other.intvalue))
+            except OverflowError:
+                pass
+        return newlong(rbigint.fromint(self.intvalue).mul(bigint(other)))
 
-    @to_long_on_overflow
     def sub(self, other):
-        return Int(ovfcheck(self.intvalue - other.int().intvalue))
+        if isinstance(other, Int):
+            try:
+                return newint(ovfcheck(self.intvalue - other.intvalue))
+            except OverflowError:
+                pass
+        return newlong(rbigint.fromint(self.intvalue).sub(bigint(other)))
 
     def str(self):
         return Str(str(self.intvalue))
 
+    def hash(self):
+        return self.intvalue
+
     def int(self):
         return self
 
@@ -195,7 +264,10 @@ class Int(Object):
         return Long(intvalue=self.intvalue)
 
     def true(self):
-        return Bool(bool(self.intvalue))
+        return newbool(bool(self.intvalue))
+
+    def is_true(self):
+        return bool(self.intvalue)
 
 
 class None_(Object):
@@ -203,35 +275,259 @@ class None_(Object):
         return Str('None')
 
     def true(self):
-        return Bool(False)
+        return FALSE
+
 
+# Concatenations shorter than this are copied right away, longer ones
+# build a rope
+ROPE_MIN_LENGTH = 64
 
 class Str(Object):
+    """
+        A string. The result of a concatenation is a rope node pointing to
+        both operands, so repeatedly appending to a string takes linear
+        instead of quadratic time. Ropes are flattened the first time
+        their value is needed.
+    """
     def __init__(self, value):
+        # The flat value, or None while the string is a rope
         self.strvalue = value
+        self.left = None
+        self.right = None
+        self.length = len(value)
+
+    def flatten(self):
+        """
+            Returns the value of the string as a flat string.
+        """
+        if self.strvalue is None:
+            builder = StringBuilder(self.length)
+            # Walk the rope iteratively, deep ropes would overflow the
+            # stack otherwise
+            todo = [self]
+            while todo:
+                node = todo.pop()
+                if node.strvalue is not None:
+                    builder.append(node.strvalue)
+                else:
+                    todo.append(node.right)
+                    todo.append(node.left)
+            self.strvalue = builder.build()
+            self.left = None
+            self.right = None
+        return self.strvalue
+
+    def eq(self, other):
+        if not isinstance(other, Str):
+            return FALSE
+        return newbool(self.length == other.length and
+                       self.flatten() == other.flatten())
+
+    def ne(self, other):
+        return newbool(not self.eq(other).boolvalue)
 
     def add(self, other):
         if not isinstance(other, Str):
             raise TypeError()
-        return Str(self.strvalue + other.strvalue)
+        if self.length == 0:
+            return other
+        elif other.length == 0:
+            return self
+        length = self.length + other.length
+        if length < ROPE_MIN_LENGTH:
+            return Str(self.flatten() + other.flatten())
+        return newrope(self, other, length)
 
     def mul(self, other):
         if not isinstance(other, Int):
             raise TypeError()
-        string = [self.strvalue for _ in xrange(other.intvalue)]
-        return Str(''.join(string))
+        value = self.flatten()
+        times = other.intvalue
+        if times <= 0 or not value:
+            return Str('')
+        builder = StringBuilder(ovfcheck(len(value) * times))
+        if len(value) == 1:
+            builder.append_multiple_char(value[0], times)
+        else:
+            for _ in xrange(times):
+                builder.append(value)
+        return Str(builder.build())
 
     def str(self):
         return self
 
+    def len(self):
+        return newint(self.length)
+
+    def repr(self):
+        return "'" + self.flatten() + "'"
+
+    def hash(self):
+        return compute_hash(self.flatten())
+
     def true(self):
-        return Bool(bool(self.strvalue))
+        return newbool(self.length != 0)
+
+def newrope(left, right, length):
+    rope = Str('')
+    rope.strvalue = None
+    rope.left = left
+    rope.right = right
+    rope.length = length
+    return rope
+
+
+class List(Object):
+    """
+        A mutable sequence, backed by a resizable array.
+    """
+    def __init__(self, items):
+        self.items = items
+
+    def index(self, index):
+        if not isinstance(index, Int):
+            raise TypeError('list indexes must be ints')
+        i = index.intvalue
+        if i < 0:
+            i += len(self.items)
+        if not 0 <= i < len(self.items):
+            raise IndexError
+        return i
+
+    def getitem(self, index):
+        return self.items[self.index(index)]
+
+    def setitem(self, index, value):
+        self.items[self.index(index)] = value
+
+    def append(self, value):
+        self.items.append(value)
+
+    def len(self):
+        return newint(len(self.items))
+
+    def iter(self):
+        return Iterator(self.items)
+
+    def hash(self):
+        raise TypeError('unhashable')
+
+    def str(self):
+        return Str('[' + ', '.join([item.repr() for item in self.items]) +
+                   ']')
+
+    def true(self):
+        return newbool(len(self.items) != 0)
+
+
+def eq_keys(key, other):
+    try:
+        return key.eq(other).is_true()
+    except TypeError:
+        return False
+
+def hash_key(key):
+    return key.hash()
+
+class Dict(Object):
+    """
+        A mapping, backed by a hash table using the keys' `hash` and `eq`.
+    """
+    def __init__(self):
+        self.entries = r_dict(eq_keys, hash_key)
+
+    def getitem(self, index):
+        return self.entries[index]
+
+    def setitem(self, index, value):
+        self.entries[index] = value
+
+    def len(self):
+        return newint(len(self.entries))
+
+    def iter(self):
+        # Iterates over a snapshot of the keys, so the dict may be
+        # changed during the iteration
+        return Iterator(self.entries.keys())
+
+    def hash(self):
+        raise TypeError('unhashable')
+
+    def str(self):
+        items = [key.repr() + ': ' + value.repr()
+                 for (key, value) in self.entries.items()]
+        return Str('{' + ', '.join(items) + '}')
+
+    def true(self):
+        return newbool(len(self.entries) != 0)
+
+
+class Iterator(Object):
+    """
+        Iterates over a list of items. Items appended to the list during
+        the iteration are included.
+    """
+    def __init__(self, items):
+        self.items = items
+        self.index = 0
+
+    def next(self):
+        """
+            Returns the next item, or None when the iteration is done.
+        """
+        if self.index >= len(self.items):
+            return None
+        item = self.items[self.index]
+        self.index += 1
+        return item
+
+    def iter(self):
+        return self
+
+
+# Canonical objects. Booleans are singletons and small ints are
+# preallocated, so arithmetic and comparisons in loops don't allocate.
+
+TRUE = Bool(True)
+FALSE = Bool(False)
+
+def newbool(value):
+    if value:
+        return TRUE
+    return FALSE
+
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 1024
+small_ints = [Int(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+def newint(value):
+    if SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+        return small_ints[value - SMALL_INT_MIN]
+    return Int(value)
 
 
 # Internal objects
 
 class Code(Object):
-    def __init__(self, code, consts, flags):
+    def __init__(self, name, code, consts, names, varnames, argcount, flags):
+        # Name of the function, or '<module>'
+        self.name = name
         self.code = code
         self.consts = consts
+        # Names of globals, indexed by LOAD_GLOBAL and STORE_GLOBAL
+        self.names = names
+        # Names of the local variables, indexed by LOAD_FAST and
+        # STORE_FAST. The first ones are the parameters.
+        self.varnames = varnames
+        self.nlocals = len(varnames)
+        self.argcount = argcount
         self.flags = flags
+        # Maximum depth of the value stack, set by barla.dis.verify
+        self.stacksize = 0
+        # Inline caches of the instructions, indexed by the pc following
+        # the instruction, and the interpreter they were filled by
+        self.inline_caches = None
+        self.cache_owner = None
+        # The Function LOAD_SELF pushes, made on first use, so the inline
+        # caches of recursive calls see the same function every time
+        self.function = None
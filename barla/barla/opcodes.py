@@ -1,9 +1,30 @@
 
 
 opcodes = dict()
-for (i, name) in enumerate('LOAD_CONST LOAD_NAME STORE_NAME ADD MUL SUB '
-                           'EQ NE LT LE GT GE JUMP_ABSOLUTE JUMP_IF_FALSE '
-                           'JUMP_IF_TRUE PRINT CALL MAKE_FUNCTION '
-                           'RETURN'.split()):
-    globals()[name] = chr(i)
-    opcodes[chr(i)] = name
+for (i, name) in enumerate('ADD MUL SUB EQ NE LT LE GT GE PRINT RETURN '
+                           'POP_TOP GET_ITEM SET_ITEM GET_ITER LOAD_SELF '
+                           'LOAD_CONST LOAD_FAST STORE_FAST LOAD_GLOBAL '
+                           'STORE_GLOBAL JUMP_ABSOLUTE JUMP_IF_FALSE '
+                           'JUMP_IF_TRUE JUMP_IF_NOT_EQ JUMP_IF_NOT_NE '
+                           'JUMP_IF_NOT_LT JUMP_IF_NOT_LE JUMP_IF_NOT_GT '
+                           'JUMP_IF_NOT_GE CALL MAKE_FUNCTION '
+                           'BUILD_LIST BUILD_DICT FOR_ITER TAIL_CALL '
+                           'EXTENDED_ARG'.split()):
+    globals()[name] = i
+    opcodes[i] = name
+
+# Opcodes from here on take an operand. An operand is a single byte; wider
+# operands are split into bytes and all but the last one are passed in
+# EXTENDED_ARG prefixes, most significant byte first.
+HAVE_ARGUMENT = LOAD_CONST
+
+BINARY_OPS = [ADD, MUL, SUB, EQ, NE, LT, LE, GT, GE]
+
+# Comparisons and the jumps they are fused with by the optimizer
+COMPARE_JUMPS = {EQ: JUMP_IF_NOT_EQ, NE: JUMP_IF_NOT_NE,
+                 LT: JUMP_IF_NOT_LT, LE: JUMP_IF_NOT_LE,
+                 GT: JUMP_IF_NOT_GT, GE: JUMP_IF_NOT_GE}
+
+# FOR_ITER jumps when its iterator is exhausted
+JUMPS = ([JUMP_ABSOLUTE, JUMP_IF_FALSE, JUMP_IF_TRUE, FOR_ITER] +
+         COMPARE_JUMPS.values())
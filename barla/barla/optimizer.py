@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.optimizer
+    ~~~~~~~~~~~~~~~
+
+    A peephole optimizer working on the assembler's instruction list,
+    before labels are resolved.
+"""
+
+from barla import opcodes
+from barla.objects import Int, Str
+
+
+# Don't fold string repetitions producing more than this many characters
+MAX_FOLDED_STR = 4096
+
+
+def optimize(asm):
+    remove_dead_stores(asm)
+    while peephole(asm):
+        pass
+
+def remove_dead_stores(asm):
+    """
+        Stores to local variables that are never loaded become POP_TOPs.
+    """
+    loaded = [False] * len(asm.varnames)
+    for instr in asm.instructions:
+        if instr.opcode == opcodes.LOAD_FAST:
+            loaded[instr.arg] = True
+    for instr in asm.instructions:
+        if instr.opcode == opcodes.STORE_FAST and not loaded[instr.arg]:
+            instr.opcode = opcodes.POP_TOP
+            instr.arg = 0
+
+def fold(opcode, lhs, rhs):
+    """
+        Evaluates a binary operation on two constants. Returns None if it
+        can't be folded.
+    """
+    if (opcode == opcodes.MUL and isinstance(lhs, Str) and
+        isinstance(rhs, Int) and
+        lhs.length * rhs.intvalue > MAX_FOLDED_STR):
+        return None
+    try:
+        if opcode == opcodes.ADD:
+            return lhs.add(rhs)
+        elif opcode == opcodes.MUL:
+            return lhs.mul(rhs)
+        elif opcode == opcodes.SUB:
+            return lhs.sub(rhs)
+        elif opcode == opcodes.EQ:
+            return lhs.eq(rhs)
+        elif opcode == opcodes.NE:
+            return lhs.ne(rhs)
+        elif opcode == opcodes.LT:
+            return lhs.lt(rhs)
+        elif opcode == opcodes.LE:
+            return lhs.le(rhs)
+        elif opcode == opcodes.GT:
+            return lhs.gt(rhs)
+        elif opcode == opcodes.GE:
+            return lhs.ge(rhs)
+    except TypeError:
+        pass
+    return None
+
+def jump_targets(instructions):
+    targets = [False] * (len(instructions) + 1)
+    for instr in instructions:
+        if instr.label is not None:
+            targets[instr.label.index] = True
+    return targets
+
+def peephole(asm):
+    """
+        One sweep over the instructions. Returns whether anything changed.
+        Instruction sequences are only rewritten if no jump lands inside
+        them.
+    """
+    instructions = asm.instructions
+    targets = jump_targets(instructions)
+    result = []
+    # Maps old instruction indexes to new ones, for the labels
+    remap = [0] * (len(instructions) + 1)
+    changed = False
+    i = 0
+    while i < len(instructions):
+        remap[i] = len(result)
+        instr = instructions[i]
+        next = None
+        if i + 1 < len(instructions) and not targets[i + 1]:
+            next = instructions[i + 1]
+        third = None
+        if next is not None and i + 2 < len(instructions) and \
+           not targets[i + 2]:
+            third = instructions[i + 2]
+
+        if (instr.opcode == opcodes.LOAD_CONST and third is not None and
+            next.opcode == opcodes.LOAD_CONST and
+            third.opcode in opcodes.BINARY_OPS):
+            # Constant folding
+            folded = fold(third.opcode, asm.consts[instr.arg],
+                          asm.consts[next.arg])
+            if folded is not None:
+                instr.arg = asm.add_const(folded)
+                result.append(instr)
+                remap[i + 1] = remap[i + 2] = remap[i]
+                i += 3
+                changed = True
+                continue
+        if (instr.opcode == opcodes.LOAD_CONST and next is not None and
+            next.opcode in [opcodes.JUMP_IF_FALSE, opcodes.JUMP_IF_TRUE]):
+            # Constant condition: the jump is either always or never taken
+            taken = (asm.consts[instr.arg].is_true() ==
+                     (next.opcode == opcodes.JUMP_IF_TRUE))
+            if taken:
+                next.opcode = opcodes.JUMP_ABSOLUTE
+                result.append(next)
+            remap[i + 1] = remap[i]
+            i += 2
+            changed = True
+            continue
+        if (instr.opcode in opcodes.COMPARE_JUMPS and next is not None and
+            next.opcode == opcodes.JUMP_IF_FALSE):
+            # Fuse comparison and conditional jump
+            next.opcode = opcodes.COMPARE_JUMPS[instr.opcode]
+            result.append(next)
+            remap[i + 1] = remap[i]
+            i += 2
+            changed = True
+            continue
+        if (instr.opcode in [opcodes.LOAD_CONST, opcodes.MAKE_FUNCTION] and
+            next is not None and next.opcode == opcodes.POP_TOP):
+            # Unused value without side effects
+            remap[i + 1] = remap[i]
+            i += 2
+            changed = True
+            continue
+        if (instr.opcode == opcodes.JUMP_ABSOLUTE and
+            instr.label.index == i + 1):
+            # Jump to the next instruction
+            i += 1
+            changed = True
+            continue
+
+        result.append(instr)
+        i += 1
+        if instr.opcode in [opcodes.RETURN, opcodes.TAIL_CALL,
+                            opcodes.JUMP_ABSOLUTE]:
+            # Drop unreachable code up to the next jump target
+            while i < len(instructions) and not targets[i]:
+                remap[i] = len(result)
+                i += 1
+                changed = True
+    remap[len(instructions)] = len(result)
+
+    # Move the labels
+    labels = {}
+    for instr in instructions:
+        if instr.label is not None:
+            labels[instr.label] = None
+    for label in labels.keys():
+        label.index = remap[label.index]
+    asm.instructions = result
+    return changed
@@ -7,20 +7,29 @@ from pypy.rlib.rsre import rsre, rsre_char, rsre_core
 from pypy.module.unicodedata import unicodedb_5_0_0 as unicodedb
 
 from barla import opcodes
+from barla.assembler import Assembler
 from barla.builtins import b_None
-from barla.objects import Code, Int, Str
+from barla.objects import Str, newint
 
 rsre.set_unicode_db(unicodedb)
 
 
+class BarlaSyntaxError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
 # A small regex implementation
 
 class RePattern(object):
     def __init__(self, pattern):
         self.code, self.groups = re_compile(pattern)
 
-    def match(self, string):
-        state = rsre.SimpleStringState(string)
+    def match(self, string, pos=0):
+        state = rsre.SimpleStringState(string, pos)
         if state.match(self.code):
             return ReMatch(self, state)
 
@@ -89,24 +98,75 @@ class WordNode(ParseTreeNode):
         print ' ' * indent + str(self), self.word
 
 class Result(object):
-    def __init__(self, tree, rest):
+    """
+        A successful match: the parsed tree and the offset into the
+        source right after the match.
+    """
+    def __init__(self, tree, pos):
         self.tree = tree
-        self.rest = rest
+        self.pos = pos
+
+class ParseState(object):
+    """
+        The source buffer that is parsed, together with the packrat memo
+        table. All parsers work on offsets into `source`, so the source
+        is never copied.
+    """
+    def __init__(self, source, memoize=True):
+        self.source = source
+        self.memoize = memoize
+        # Maps (offset, rule) to the rule's result at that offset (or
+        # None if the rule failed there)
+        self.memo = {}
+
+def next_statement(state, pos):
+    """
+        Parses the top-level statement at `pos`, or returns None if there
+        is none. Later statements never look at offsets before the end of
+        this one, so the memo table is dropped afterwards. That bounds the
+        memory used for parsing by the largest top-level statement instead
+        of the whole source.
+    """
+    result = statement.parse(state, pos)
+    state.memo.clear()
+    return result
 
 class Parser(object):
     """
         Base class for all parsers.
     """
+    # Number of named rules (see `setup`), used to build memo keys
+    rules = 0
+
     def __init__(self, transformer=None, *args, **kwargs):
         """NOT_RPYTHON"""
         super(Parser, self).__init__(*args, **kwargs)
         self.parser = None
         self.transformer = transformer
+        self.rule = -1
 
     def match(self, string):
-        match = self.parser.match(string)
+        return self.parse(ParseState(string), 0)
+
+    def parse(self, state, pos):
+        """
+            Parses a named rule at `pos`. Each rule is only applied once
+            per offset, so parse time is linear in the size of the
+            source.
+        """
+        key = pos * Parser.rules + self.rule
+        if state.memoize and key in state.memo:
+            return state.memo[key]
+        match = self.parser.parse(state, pos)
         if match is not None and self.transformer is not None:
-            match.tree = self.transformer(match.tree)
+            tree = self.transformer(match.tree)
+            # Transformers reject a match by returning None
+            if tree is None:
+                match = None
+            else:
+                match = Result(tree, match.pos)
+        if state.memoize:
+            state.memo[key] = match
         return match
 
 class Word(Parser):
@@ -116,10 +176,10 @@ class Word(Parser):
         expr = '\s*(%s)' % (expr, )
         self.regex = RePattern(expr)
 
-    def match(self, string):
-        match = self.regex.match(string)
+    def parse(self, state, pos):
+        match = self.regex.match(state.source, pos)
         if match:
-            return Result(WordNode(match.group(1)), string[match.end():])
+            return Result(WordNode(match.group(1)), match.end())
         return None
 
 class Any(Parser):
@@ -128,9 +188,9 @@ class Any(Parser):
         super(Any, self).__init__(**kwargs)
         self.parsers = parserize(parsers)
 
-    def match(self, string):
+    def parse(self, state, pos):
         for parser in self.parsers:
-            match = parser.match(string)
+            match = parser.parse(state, pos)
             if match is not None:
                 return match
         return None
@@ -144,11 +204,11 @@ class Opt(Parser):
         super(Opt, self).__init__(*args, **kwargs)
         self.parser = parser
 
-    def match(self, string):
-        match = self.parser.match(string)
+    def parse(self, state, pos):
+        match = self.parser.parse(state, pos)
         if match is not None:
             return match
-        return Result(ASTNode(), string)
+        return Result(ASTNode(), pos)
 
 class Rep(Parser):
     """
@@ -159,15 +219,15 @@ class Rep(Parser):
         super(Rep, self).__init__(*args, **kwargs)
         self.parser = parser
 
-    def match(self, string):
+    def parse(self, state, pos):
         result = ASTNode()
         while True:
-            match = self.parser.match(string)
+            match = self.parser.parse(state, pos)
             if match is None:
                 break
-            string = match.rest
+            pos = match.pos
             result.children.append(match.tree)
-        return Result(result, string)
+        return Result(result, pos)
 
 class Seq(Parser):
     """
@@ -178,15 +238,15 @@ class Seq(Parser):
         super(Seq, self).__init__(**kwargs)
         self.parsers = parserize(parsers)
 
-    def match(self, string):
+    def parse(self, state, pos):
         result = ASTNode()
         for parser in self.parsers:
-            match = parser.match(string)
+            match = parser.parse(state, pos)
             if match is None:
                 return None
-            string = match.rest
+            pos = match.pos
             result.children.append(match.tree)
-        return Result(result, string)
+        return Result(result, pos)
 
 def setup(dict_):
     """NOT_RPYTHON
@@ -194,8 +254,10 @@ def setup(dict_):
     """
     parsers = [n for n in dict_.iterkeys() if n.startswith('p_')]
     # Create parser instances first, so other parsers can reference them
-    for name in parsers:
+    for (i, name) in enumerate(parsers):
         dict_[name[2:]] = Parser(dict_[name])
+        dict_[name[2:]].rule = i
+    Parser.rules = len(parsers)
     # Now set the real parsers
     for name in parsers:
         dict_[name[2:]].parser = eval(dict_[name].__doc__, dict_, dict_)
@@ -215,17 +277,46 @@ def p_expression(tree):
     return left(tree.children[0], tree.children[1].children)
 
 def p_term(tree):
-    "Seq(Any(number, name, string), Rep(call))"
+    """Seq(Any(number, name, string, list_display, dict_display),
+           Rep(Any(call, subscript)))"""
     term = tree.children[0]
-    if tree.children[1].children:
-        for arglist in tree.children[1].children:
-            term = Call(term, arglist.children)
+    for suffix in tree.children[1].children:
+        if isinstance(suffix, Subscript):
+            term = Subscript(term, suffix.index)
+        else:
+            term = Call(term, suffix.children)
     return term
 
 def p_call(tree):
     "Seq('(', Opt(arglist), ')')"
     return tree.children[1]
 
+def p_subscript(tree):
+    "Seq('[', expression, ']')"
+    # The subscripted expression is filled in by `p_term`
+    return Subscript(None, tree.children[1])
+
+def p_list_display(tree):
+    "Seq('[', Opt(arglist), ']')"
+    return ListDisplay(tree.children[1].children)
+
+def p_dict_display(tree):
+    "Seq('{', Opt(dict_items), '}')"
+    return DictDisplay(tree.children[1].children)
+
+def p_dict_items(tree):
+    """Seq(Rep(Seq(expression, ':', expression, ',')),
+           expression, ':', expression)"""
+    items = []
+    for child in tree.children[0].children:
+        items.append(child.children[0])
+        items.append(child.children[2])
+    items.append(tree.children[1])
+    items.append(tree.children[3])
+    tree = ASTNode()
+    tree.children = items
+    return tree
+
 def p_arglist(tree):
     "Seq(Rep(Seq(expression, ',')), expression)"
     arguments = [child.children[0] for child in
@@ -243,7 +334,7 @@ def p_number(tree):
     r"Word(r'[+-]?\d+')"
     assert tree.word is not None
     value = int(tree.word)
-    return Const(Int(value))
+    return Const(newint(value))
 
 def p_paramlist(tree):
     "Seq(Rep(Seq(name, ',')), name)"
@@ -263,6 +354,21 @@ def p_assign_stmt(tree):
     "Seq(name, ':=', expression)"
     return Assign(tree.children[0].name, tree.children[2])
 
+def p_setitem_stmt(tree):
+    "Seq(term, ':=', expression)"
+    target = tree.children[0]
+    if not isinstance(target, Subscript):
+        return None
+    return SetItem(target.expr, target.index, tree.children[2])
+
+def p_call_stmt(tree):
+    "Seq(term)"
+    # Only calls are useful as statements
+    call = tree.children[0]
+    if not isinstance(call, Call):
+        return None
+    return ExprStatement(call)
+
 def p_funcdef(tree):
     "Seq(name, '(', Opt(paramlist), ')', ':', statements, '.')"
     name = tree.children[0].name
@@ -283,6 +389,11 @@ def p_while_stmt(tree):
     "Seq('while', condition, ':', statements, '.')"
     return While(tree.children[1], tree.children[3].children)
 
+def p_for_stmt(tree):
+    "Seq('for', name, 'in', expression, ':', statements, '.')"
+    return For(tree.children[1].name, tree.children[3],
+               tree.children[5].children)
+
 def p_condition(tree):
     """Seq(expression, Rep(Seq(Any('==', '!=', '<=', '<', '>=', '>'),
                                expression)))"""
@@ -296,9 +407,13 @@ def p_return_stmt(tree):
     "Seq('return', expression)"
     return Return(tree.children[1])
 
+def p_statement(tree):
+    """Any(assign_stmt, setitem_stmt, funcdef, if_else_stmt, if_stmt,
+           print_stmt, return_stmt, while_stmt, for_stmt, call_stmt)"""
+    return tree
+
 def p_statements(tree):
-    """Rep(Any(assign_stmt, funcdef, if_else_stmt, if_stmt, print_stmt,
-               return_stmt, while_stmt))"""
+    "Rep(statement)"
     return tree
 
 
@@ -308,6 +423,24 @@ class ASTNode(ParseTreeNode):
     """
         Base class for all AST nodes.
     """
+    def find_locals(self, varnames):
+        """
+            Scope analysis: adds all names this statement binds to
+            `varnames`. Nested functions have their own scope.
+        """
+
+def find_locals(params, body):
+    varnames = list(params)
+    for stmt in body:
+        stmt.find_locals(varnames)
+    return varnames
+
+def compile_store(asm, name):
+    slot = asm.local_slot(name)
+    if slot >= 0:
+        asm.emit(opcodes.STORE_FAST, slot)
+    else:
+        asm.emit(opcodes.STORE_GLOBAL, asm.add_name(name))
 
 class Assign(ASTNode):
     def __init__(self, name, expr):
@@ -315,17 +448,13 @@ class Assign(ASTNode):
         self.name = name
         self.expr = expr
 
-    def compile(self, code, consts, flags):
-        flags = self.expr.compile(code, consts, flags)
-        name = Str(self.name)
-        try:
-            index = consts.index(name)
-        except ValueError:
-            index = len(consts)
-            consts.append(name)
-        code.append(opcodes.STORE_NAME)
-        code.append(chr(index))
-        return flags
+    def compile(self, asm):
+        self.expr.compile(asm)
+        compile_store(asm, self.name)
+
+    def find_locals(self, varnames):
+        if self.name not in varnames:
+            varnames.append(self.name)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self), self.name
@@ -349,11 +478,10 @@ class BinaryOp(ASTNode):
         self.left = left
         self.right = right
 
-    def compile(self, code, consts, flags):
-        flags = self.left.compile(code, consts, flags)
-        flags = self.right.compile(code, consts, flags)
-        code.append(self.ops[self.op])
-        return flags
+    def compile(self, asm):
+        self.left.compile(asm)
+        self.right.compile(asm)
+        asm.emit(self.ops[self.op])
 
     def dump(self, indent=0):
         print ' ' * indent + str(self), self.op
@@ -365,15 +493,19 @@ class Call(ASTNode):
         self.expr = expr
         self.arguments = arguments
 
-    def compile(self, code, consts, flags):
+    def compile(self, asm):
+        self.compile_arguments(asm)
+        asm.emit(opcodes.CALL, len(self.arguments))
+
+    def compile_arguments(self, asm):
+        """
+            Pushes the arguments, last one first, and the function.
+        """
         arguments = list(self.arguments)
         arguments.reverse()
         for arg in arguments:
-            flags = arg.compile(code, consts, flags)
-        self.expr.compile(code, consts, flags)
-        code.append(opcodes.CALL)
-        code.append(chr(len(self.arguments)))
-        return flags
+            arg.compile(asm)
+        self.expr.compile(asm)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self)
@@ -381,6 +513,74 @@ class Call(ASTNode):
         for arg in self.arguments:
             arg.dump(indent + 4)
 
+class Subscript(ASTNode):
+    def __init__(self, expr, index):
+        ASTNode.__init__(self)
+        self.expr = expr
+        self.index = index
+
+    def compile(self, asm):
+        self.expr.compile(asm)
+        self.index.compile(asm)
+        asm.emit(opcodes.GET_ITEM)
+
+    def dump(self, indent=0):
+        print ' ' * indent + str(self)
+        self.expr.dump(indent + 4)
+        self.index.dump(indent + 4)
+
+class SetItem(ASTNode):
+    def __init__(self, expr, index, value):
+        ASTNode.__init__(self)
+        self.expr = expr
+        self.index = index
+        self.value = value
+
+    def compile(self, asm):
+        self.expr.compile(asm)
+        self.index.compile(asm)
+        self.value.compile(asm)
+        asm.emit(opcodes.SET_ITEM)
+
+    def dump(self, indent=0):
+        print ' ' * indent + str(self)
+        self.expr.dump(indent + 4)
+        self.index.dump(indent + 4)
+        self.value.dump(indent + 4)
+
+class ListDisplay(ASTNode):
+    def __init__(self, items):
+        ASTNode.__init__(self)
+        self.items = items
+
+    def compile(self, asm):
+        for item in self.items:
+            item.compile(asm)
+        asm.emit(opcodes.BUILD_LIST, len(self.items))
+
+    def dump(self, indent=0):
+        print ' ' * indent + str(self)
+        for item in self.items:
+            item.dump(indent + 4)
+
+class DictDisplay(ASTNode):
+    """
+        A dict literal. `items` holds the keys and values alternately.
+    """
+    def __init__(self, items):
+        ASTNode.__init__(self)
+        self.items = items
+
+    def compile(self, asm):
+        for item in self.items:
+            item.compile(asm)
+        asm.emit(opcodes.BUILD_DICT, len(self.items) // 2)
+
+    def dump(self, indent=0):
+        print ' ' * indent + str(self)
+        for item in self.items:
+            item.dump(indent + 4)
+
 class Const(ASTNode):
     """
         AST node representing a constant value.
@@ -389,18 +589,11 @@ class Const(ASTNode):
         ASTNode.__init__(self)
         self.constvalue = value
 
-    def compile(self, code, consts, flags):
-        try:
-            index = consts.index(self.constvalue)
-        except ValueError:
-            index = len(consts)
-            consts.append(self.constvalue)
-        code.append(opcodes.LOAD_CONST)
-        code.append(chr(index))
-        return flags
+    def compile(self, asm):
+        asm.emit(opcodes.LOAD_CONST, asm.add_const(self.constvalue))
 
     def dump(self, indent=0):
-        print ' ' * indent + str(self), self.constvalue.str().strvalue
+        print ' ' * indent + str(self), self.constvalue.str().flatten()
 
 class FunctionDef(ASTNode):
     def __init__(self, name, params, body):
@@ -408,35 +601,31 @@ class FunctionDef(ASTNode):
         self.params = params
         self.body = body
 
-    def compile(self, code, consts, flags):
+    def compile(self, asm):
         # Compile function code
-        fcode = []
-        fconsts = []
-        fflags = 0
-        params = list(self.params)
-        params.reverse()
-        # Pop parameters from stack to names in the new function
-        for name in params:
-            fcode.append(opcodes.STORE_NAME)
-            fcode.append(chr(len(fconsts)))
-            fconsts.append(Str(name))
+        # The caller puts the arguments into the parameters' slots
+        fasm = Assembler(self.name, find_locals(self.params, self.body),
+                         len(self.params), asm.optimize)
+        if asm.local_slot(self.name) >= 0:
+            # A nested function is bound to a local of the enclosing
+            # function, which its own code can't see
+            fasm.self_name = self.name
+        # Functions don't capture anything, so the locals of the
+        # enclosing functions must not be referred to
+        fasm.enclosing_names = asm.enclosing_names + asm.varnames
         # Compile the new function's code
         for stmt in self.body:
-            fflags = stmt.compile(fcode, fconsts, fflags)
+            stmt.compile(fasm)
         # Default return value
-        fcode.append(opcodes.LOAD_CONST)
-        fcode.append(chr(len(fconsts)))
-        fconsts.append(b_None)
-        fcode.append(opcodes.RETURN)
+        fasm.emit(opcodes.LOAD_CONST, fasm.add_const(b_None))
+        fasm.emit(opcodes.RETURN)
         # Add creation code
-        codeobj = Code(''.join(fcode), fconsts, fflags)
-        code.append(opcodes.MAKE_FUNCTION)
-        code.append(chr(len(consts)))
-        consts.append(codeobj)
-        code.append(opcodes.STORE_NAME)
-        code.append(chr(len(consts)))
-        consts.append(Str(self.name))
-        return flags
+        asm.emit(opcodes.MAKE_FUNCTION, asm.add_const(fasm.assemble()))
+        compile_store(asm, self.name)
+
+    def find_locals(self, varnames):
+        if self.name not in varnames:
+            varnames.append(self.name)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self) + '%s(%s)' % (self.name,
@@ -450,18 +639,19 @@ class If(ASTNode):
         self.condition = condition
         self.body = body
 
-    def compile(self, code, consts, flags):
-        flags = self.condition.compile(code, consts, flags)
-        code.append(opcodes.JUMP_IF_FALSE)
-        jump_offset_pos = len(code)
-        # Placeholder
-        code.append(chr(0xff))
+    def compile(self, asm):
+        end = asm.new_label()
+        self.condition.compile(asm)
+        asm.emit_jump(opcodes.JUMP_IF_FALSE, end)
 
         for stmt in self.body:
-            flags = stmt.compile(code, consts, flags)
+            stmt.compile(asm)
+
+        asm.set_label(end)
 
-        code[jump_offset_pos] = chr(len(code) - jump_offset_pos)
-        return flags
+    def find_locals(self, varnames):
+        for stmt in self.body:
+            stmt.find_locals(varnames)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self)
@@ -476,29 +666,27 @@ class IfElse(ASTNode):
         self.body = body
         self.else_body = else_body
 
-    def compile(self, code, consts, flags):
-        flags = self.condition.compile(code, consts, flags)
-        code.append(opcodes.JUMP_IF_FALSE)
-        jump_offset_pos = len(code)
-        # Placeholder
-        code.append(chr(0xff))
+    def compile(self, asm):
+        else_ = asm.new_label()
+        end = asm.new_label()
+        self.condition.compile(asm)
+        asm.emit_jump(opcodes.JUMP_IF_FALSE, else_)
 
         for stmt in self.body:
-            flags = stmt.compile(code, consts, flags)
-        code.append(opcodes.JUMP_ABSOLUTE)
-        # Add jump flag
-        flags |= 1
-        end_if_jump_offset_pos = len(code)
-        # Placeholder
-        code.append(chr(0xff))
-
-        code[jump_offset_pos] = chr(len(code) - jump_offset_pos)
+            stmt.compile(asm)
+        asm.emit_jump(opcodes.JUMP_ABSOLUTE, end)
 
+        asm.set_label(else_)
         for stmt in self.else_body:
-            flags = stmt.compile(code, consts, flags)
+            stmt.compile(asm)
+
+        asm.set_label(end)
 
-        code[end_if_jump_offset_pos] = chr(len(code))
-        return flags
+    def find_locals(self, varnames):
+        for stmt in self.body:
+            stmt.find_locals(varnames)
+        for stmt in self.else_body:
+            stmt.find_locals(varnames)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self)
@@ -516,29 +704,45 @@ class Name(ASTNode):
         ASTNode.__init__(self)
         self.name = name
 
-    def compile(self, code, consts, flags):
-        name = Str(self.name)
-        try:
-            index = consts.index(name)
-        except ValueError:
-            index = len(consts)
-            consts.append(name)
-        code.append(opcodes.LOAD_NAME)
-        code.append(chr(index))
-        return flags
+    def compile(self, asm):
+        slot = asm.local_slot(self.name)
+        if slot >= 0:
+            asm.emit(opcodes.LOAD_FAST, slot)
+        elif self.name == asm.self_name:
+            asm.emit(opcodes.LOAD_SELF)
+        elif self.name in asm.enclosing_names:
+            raise BarlaSyntaxError("'%s' refers to '%s' of an enclosing "
+                                   "function" % (asm.name, self.name))
+        else:
+            asm.emit(opcodes.LOAD_GLOBAL, asm.add_name(self.name))
 
     def dump(self, indent=0):
         print ' ' * indent + str(self), self.name
 
+class ExprStatement(ASTNode):
+    """
+        An expression evaluated for its side effects.
+    """
+    def __init__(self, expr):
+        ASTNode.__init__(self)
+        self.expr = expr
+
+    def compile(self, asm):
+        self.expr.compile(asm)
+        asm.emit(opcodes.POP_TOP)
+
+    def dump(self, indent=0):
+        print ' ' * indent + str(self)
+        self.expr.dump(indent + 4)
+
 class Print(ASTNode):
     def __init__(self, expr):
         ASTNode.__init__(self)
         self.expr = expr
 
-    def compile(self, code, consts, flags):
-        flags = self.expr.compile(code, consts, flags)
-        code.append(opcodes.PRINT)
-        return flags
+    def compile(self, asm):
+        self.expr.compile(asm)
+        asm.emit(opcodes.PRINT)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self)
@@ -549,10 +753,16 @@ class Return(ASTNode):
         ASTNode.__init__(self)
         self.expr = expr
 
-    def compile(self, code, consts, flags):
-        flags = self.expr.compile(code, consts, flags)
-        code.append(opcodes.RETURN)
-        return flags
+    def compile(self, asm):
+        if isinstance(self.expr, Call):
+            # A call in tail position reuses the current frame. This is
+            # not an optimization but what keeps deep tail recursion in
+            # constant space, so it happens with --no-optimize as well.
+            self.expr.compile_arguments(asm)
+            asm.emit(opcodes.TAIL_CALL, len(self.expr.arguments))
+            return
+        self.expr.compile(asm)
+        asm.emit(opcodes.RETURN)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self)
@@ -564,23 +774,22 @@ class While(ASTNode):
         self.condition = condition
         self.body = body
 
-    def compile(self, code, consts, flags):
-        loop_begin_pos = len(code)
-        flags = self.condition.compile(code, consts, flags)
-        code.append(opcodes.JUMP_IF_FALSE)
-        jump_offset_pos = len(code)
-        # Placeholder
-        code.append(chr(0xff))
+    def compile(self, asm):
+        begin = asm.new_label()
+        end = asm.new_label()
+        asm.set_label(begin)
+        self.condition.compile(asm)
+        asm.emit_jump(opcodes.JUMP_IF_FALSE, end)
 
         for stmt in self.body:
-            flag = stmt.compile(code, consts, flags)
-        code.append(opcodes.JUMP_ABSOLUTE)
-        code.append(chr(loop_begin_pos))
-        # Add jump flag
-        flags |= 1
+            stmt.compile(asm)
+        asm.emit_jump(opcodes.JUMP_ABSOLUTE, begin)
 
-        code[jump_offset_pos] = chr(len(code) - jump_offset_pos)
-        return flags
+        asm.set_label(end)
+
+    def find_locals(self, varnames):
+        for stmt in self.body:
+            stmt.find_locals(varnames)
 
     def dump(self, indent=0):
         print ' ' * indent + str(self)
@@ -588,5 +797,39 @@ class While(ASTNode):
         for stmt in self.body:
             stmt.dump(indent + 4)
 
+class For(ASTNode):
+    def __init__(self, name, iterable, body):
+        ASTNode.__init__(self)
+        self.name = name
+        self.iterable = iterable
+        self.body = body
+
+    def compile(self, asm):
+        begin = asm.new_label()
+        end = asm.new_label()
+        self.iterable.compile(asm)
+        asm.emit(opcodes.GET_ITER)
+        asm.set_label(begin)
+        asm.emit_jump(opcodes.FOR_ITER, end)
+        compile_store(asm, self.name)
+
+        for stmt in self.body:
+            stmt.compile(asm)
+        asm.emit_jump(opcodes.JUMP_ABSOLUTE, begin)
+
+        asm.set_label(end)
+
+    def find_locals(self, varnames):
+        if self.name not in varnames:
+            varnames.append(self.name)
+        for stmt in self.body:
+            stmt.find_locals(varnames)
+
+    def dump(self, indent=0):
+        print ' ' * indent + str(self), self.name
+        self.iterable.dump(indent + 4)
+        for stmt in self.body:
+            stmt.dump(indent + 4)
+
 
 setup(globals())
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.pool
+    ~~~~~~~~~~
+
+    Runs many independent programs in a pool of forked worker processes,
+    each with its own interpreter.
+
+    The parent writes the indexes of the programs into a pipe as fixed
+    size records, which the workers take one at a time, so a worker that
+    got a short program simply takes the next one. Every worker writes the
+    captured output of its programs to a result file, which the parent
+    reads once all workers exited.
+"""
+
+import errno
+import os
+
+from pypy.rlib.streamio import open_file_as_stream
+
+from barla import BarlaSyntaxError, Interpreter, compile
+from barla.interpreter import BarlaNameError
+from barla.serialize import FormatError, Reader, dump_int, dump_str
+
+
+# Size of a task record. Pipe writes of up to PIPE_BUF bytes are atomic
+# and all reads take exactly one record, so workers never split one.
+RECORD_SIZE = 8
+
+
+class Result(object):
+    def __init__(self, filename):
+        self.filename = filename
+        # 'ok', or what went wrong
+        self.status = 'not run'
+        # The lines printed by the program
+        self.output = []
+
+
+def run_programs(filenames, jobs, optimize, use_cache, int_fast_path,
+                 inline_caches):
+    """
+        Compiles and runs `filenames` in `jobs` worker processes. Returns
+        a list of Result objects in the order of `filenames`.
+    """
+    tmpdir = make_private_dir()
+    try:
+        return run_workers(filenames, jobs, tmpdir, optimize, use_cache,
+                           int_fast_path, inline_caches)
+    finally:
+        for name in os.listdir(tmpdir):
+            os.unlink(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+def make_private_dir():
+    """
+        Creates a directory only the current user can access, like
+        tempfile.mkdtemp (which RPython can't translate), and returns its
+        path. mkdir fails on any existing entry, symlinks included, so
+        the directory can't be planted by someone else.
+    """
+    base = os.environ.get('TMPDIR', '/tmp')
+    pid = os.getpid()
+    attempt = 0
+    while True:
+        path = os.path.join(base, 'barla-%d-%d' % (pid, attempt))
+        try:
+            os.mkdir(path, 0700)
+            return path
+        except OSError, e:
+            if e.errno != errno.EEXIST or attempt >= 1000:
+                raise
+        attempt += 1
+
+def run_workers(filenames, jobs, tmpdir, optimize, use_cache, int_fast_path,
+                inline_caches):
+    (tasks_in, tasks_out) = os.pipe()
+    prefix = os.path.join(tmpdir, 'results-')
+    pids = []
+    for job in xrange(jobs):
+        pid = os.fork()
+        if pid == 0:
+            # Whatever happens, the worker must not return into the
+            # parent's code
+            status = 1
+            try:
+                os.close(tasks_out)
+                work(filenames, tasks_in, prefix + str(job), optimize,
+                     use_cache, int_fast_path, inline_caches)
+                status = 0
+            finally:
+                os._exit(status)
+        pids.append(pid)
+    os.close(tasks_in)
+    for i in xrange(len(filenames)):
+        record = str(i)
+        os.write(tasks_out, record + ' ' * (RECORD_SIZE - len(record)))
+    os.close(tasks_out)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    results = [Result(filename) for filename in filenames]
+    for job in xrange(jobs):
+        read_results(prefix + str(job), results)
+    return results
+
+def work(filenames, tasks, result_filename, optimize, use_cache,
+         int_fast_path, inline_caches):
+    """
+        The main loop of a worker process: runs the programs it gets from
+        the `tasks` pipe and writes their results.
+    """
+    interpreter = Interpreter()
+    interpreter.int_fast_path = int_fast_path
+    interpreter.use_inline_caches = inline_caches
+    f = open_file_as_stream(result_filename, 'w')
+    try:
+        while True:
+            record = os.read(tasks, RECORD_SIZE)
+            if not record:
+                break
+            index = int(record.strip())
+            interpreter.reset_globals()
+            interpreter.output = []
+            status = run_program(interpreter, filenames[index], optimize,
+                                 use_cache)
+            out = []
+            dump_int(out, index)
+            dump_str(out, status)
+            dump_int(out, len(interpreter.output))
+            for line in interpreter.output:
+                dump_str(out, line)
+            interpreter.output = None
+            f.write(''.join(out))
+    finally:
+        f.close()
+
+def run_program(interpreter, filename, optimize, use_cache):
+    """
+        Compiles and runs one program, returns its status.
+    """
+    try:
+        code = compile(filename, False, optimize, use_cache)
+    except OSError:
+        return 'cannot read file'
+    except BarlaSyntaxError, e:
+        return 'syntax error: %s' % (e.msg, )
+    return run_code(interpreter, code)
+
+def run_code(interpreter, code):
+    """
+        Runs a compiled program with the JIT, returns its status. After an
+        error the interpreter is ready for the next program.
+    """
+    try:
+        interpreter.execute(code, True)
+    except BarlaNameError, e:
+        interpreter.abort()
+        return 'name error: %s' % (e.name, )
+    except TypeError:
+        interpreter.abort()
+        return 'type error'
+    except IndexError:
+        interpreter.abort()
+        return 'index error'
+    except KeyError:
+        interpreter.abort()
+        return 'key error'
+    # Errors of the VM itself. They must not kill the worker, which would
+    # leave its remaining programs not run.
+    except RuntimeError:
+        interpreter.abort()
+        return 'internal error: RuntimeError'
+    except OverflowError:
+        interpreter.abort()
+        return 'internal error: OverflowError'
+    except Exception:
+        interpreter.abort()
+        return 'internal error: Exception'
+    return 'ok'
+
+def read_results(result_filename, results):
+    try:
+        f = open_file_as_stream(result_filename)
+        try:
+            data = f.readall()
+        finally:
+            f.close()
+        os.unlink(result_filename)
+    except OSError:
+        return
+    reader = Reader(data)
+    try:
+        while reader.pos < len(data):
+            index = reader.read_int()
+            if not 0 <= index < len(results):
+                raise FormatError('invalid program index')
+            result = results[index]
+            result.status = reader.read_str()
+            result.output = [reader.read_str()
+                             for _ in xrange(reader.read_int())]
+    except FormatError:
+        # A worker died while writing; its remaining programs show up as
+        # not run
+        pass
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.profiler
+    ~~~~~~~~~~~~~~
+
+    Opt-in instrumentation of the VM: counts executed opcodes, calls and
+    instructions per code object, the time spent in each code object and
+    how often each instruction was executed.
+"""
+
+import time
+
+from pypy.rlib.listsort import TimSort
+
+from barla import opcodes
+from barla.dis import decode
+
+
+class CodeProfile(object):
+    def __init__(self, code):
+        self.code = code
+        self.calls = 0
+        self.instructions = 0
+        # Time spent in this code object itself, without its callees
+        self.time = 0.0
+        # Execution count of the instruction starting at each pc
+        self.heat = [0] * len(code.code)
+
+class ProfileSort(TimSort):
+    def lt(self, a, b):
+        return a.time > b.time
+
+class OpcodeSort(TimSort):
+    def lt(self, a, b):
+        return a[0] > b[0]
+
+
+class Profiler(object):
+    def __init__(self):
+        self.opcode_counts = [0] * len(opcodes.opcodes)
+        self.profiles = {}
+        # All profiles, in the order their code was first executed
+        self.order = []
+        self.current = None
+        self.since = 0.0
+
+    def get_profile(self, code):
+        try:
+            return self.profiles[code]
+        except KeyError:
+            profile = CodeProfile(code)
+            self.profiles[code] = profile
+            self.order.append(profile)
+            return profile
+
+    def instruction(self, code, pc, opcode):
+        """
+            Called by the VM for every executed instruction.
+        """
+        current = self.current
+        if current is None or current.code is not code:
+            self.switch(code)
+            current = self.current
+        current.instructions += 1
+        current.heat[pc] += 1
+        self.opcode_counts[opcode] += 1
+
+    def call(self, code):
+        """
+            Called by the VM whenever a code object is entered.
+        """
+        self.get_profile(code).calls += 1
+
+    def switch(self, code):
+        now = time.clock()
+        if self.current is not None:
+            self.current.time += now - self.since
+        self.since = now
+        self.current = self.get_profile(code)
+
+    def stop(self):
+        """
+            Called by the VM when it leaves the dispatch loop.
+        """
+        if self.current is not None:
+            self.current.time += time.clock() - self.since
+            self.current = None
+
+    def total_instructions(self):
+        total = 0
+        for count in self.opcode_counts:
+            total += count
+        return total
+
+    def report(self, heat=True):
+        profiles = list(self.order)
+        ProfileSort(profiles).sort()
+        print 'Flat profile:'
+        print '%10s %14s %12s  %s' % ('calls', 'instructions', 'seconds',
+                                      'function')
+        for profile in profiles:
+            print '%10d %14d %12.6f  %s' % (profile.calls,
+                                            profile.instructions,
+                                            profile.time, profile.code.name)
+        print
+
+        counts = [(count, opcode) for (opcode, count)
+                  in enumerate(self.opcode_counts) if count]
+        OpcodeSort(counts).sort()
+        print 'Opcodes:'
+        for (count, opcode) in counts:
+            print '%14d  %s' % (count, opcodes.opcodes[opcode])
+        print
+
+        if heat:
+            for profile in self.order:
+                self.report_heat(profile)
+
+    def report_heat(self, profile):
+        print 'Heat map of %s:' % (profile.code.name, )
+        code = profile.code.code
+        hottest = 0
+        for count in profile.heat:
+            hottest = max(hottest, count)
+        pc = 0
+        while pc < len(code):
+            start = pc
+            (opcode, value, pc) = decode(code, pc)
+            arg = ''
+            if opcode >= opcodes.HAVE_ARGUMENT:
+                arg = str(value)
+            count = profile.heat[start]
+            share = 0
+            if hottest:
+                share = count * 40 / hottest
+            print '%6d %12d  %-16s %-8s %s' % (start, count,
+                                                opcodes.opcodes[opcode], arg,
+                                                '#' * share)
+        print
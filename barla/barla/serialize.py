@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+    barla.serialize
+    ~~~~~~~~~~~~~~~
+
+    Serialization of code objects, used for the compiled bytecode cache
+    (.blc files next to the sources).
+
+    Integers are written in decimal and terminated by ';', strings are
+    written as their length followed by the raw bytes, every constant
+    starts with a one character tag.
+"""
+
+from pypy.rlib.rbigint import rbigint
+
+from barla.builtins import b_None
+from barla.dis import VerifyError, verify
+from barla.objects import (Code, Int, Long, Str, FALSE, TRUE, newint,
+                           newlong)
+
+
+class FormatError(Exception):
+    pass
+
+
+def dump(code):
+    """
+        Returns the serialized form of `code`.
+    """
+    out = []
+    dump_code(out, code)
+    return ''.join(out)
+
+def load(data):
+    """
+        Returns the code object serialized in `data`. Raises FormatError
+        if `data` is malformed or its bytecode does not verify.
+    """
+    reader = Reader(data)
+    code = reader.read_code()
+    if reader.pos != len(data):
+        raise FormatError('trailing data')
+    return code
+
+
+def dump_int(out, value):
+    out.append(str(value))
+    out.append(';')
+
+def dump_str(out, value):
+    dump_int(out, len(value))
+    out.append(value)
+
+def dump_code(out, code):
+    out.append('C')
+    dump_str(out, code.name)
+    dump_str(out, code.code)
+    dump_int(out, len(code.consts))
+    for const in code.consts:
+        dump_const(out, const)
+    dump_int(out, len(code.names))
+    for name in code.names:
+        dump_str(out, name)
+    dump_int(out, len(code.varnames))
+    for name in code.varnames:
+        dump_str(out, name)
+    dump_int(out, code.argcount)
+    dump_int(out, code.flags)
+
+def dump_const(out, const):
+    if isinstance(const, Int):
+        out.append('i')
+        dump_int(out, const.intvalue)
+    elif isinstance(const, Long):
+        out.append('l')
+        dump_str(out, const.longvalue.str())
+    elif isinstance(const, Str):
+        out.append('s')
+        dump_str(out, const.flatten())
+    elif const is TRUE:
+        out.append('T')
+    elif const is FALSE:
+        out.append('F')
+    elif const is b_None:
+        out.append('N')
+    elif isinstance(const, Code):
+        dump_code(out, const)
+    else:
+        raise FormatError('cannot serialize constant')
+
+
+def long_from_decimal(digits):
+    negative = digits.startswith('-')
+    if negative:
+        digits = digits[1:]
+    result = rbigint.fromint(0)
+    ten = rbigint.fromint(10)
+    for digit in digits:
+        if not '0' <= digit <= '9':
+            raise FormatError('invalid long')
+        result = result.mul(ten).add(rbigint.fromint(ord(digit) - ord('0')))
+    if negative:
+        result = rbigint.fromint(0).sub(result)
+    return result
+
+
+class Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read_char(self):
+        if self.pos >= len(self.data):
+            raise FormatError('unexpected end of data')
+        char = self.data[self.pos]
+        self.pos += 1
+        return char
+
+    def read_int(self):
+        end = self.data.find(';', self.pos)
+        if end < 0 or end == self.pos:
+            raise FormatError('invalid integer')
+        start = self.pos
+        assert start >= 0
+        self.pos = end + 1
+        try:
+            return int(self.data[start:end])
+        except ValueError:
+            raise FormatError('invalid integer')
+
+    def read_str(self):
+        length = self.read_int()
+        start = self.pos
+        end = start + length
+        if length < 0 or end > len(self.data):
+            raise FormatError('invalid string')
+        assert start >= 0 and end >= 0
+        self.pos = end
+        return self.data[start:end]
+
+    def read_code(self):
+        if self.read_char() != 'C':
+            raise FormatError('code object expected')
+        name = self.read_str()
+        code = self.read_str()
+        consts = [self.read_const() for _ in xrange(self.read_int())]
+        names = [self.read_str() for _ in xrange(self.read_int())]
+        varnames = [self.read_str() for _ in xrange(self.read_int())]
+        argcount = self.read_int()
+        flags = self.read_int()
+        code = Code(name, code, consts, names, varnames, argcount, flags)
+        try:
+            verify(code)
+        except VerifyError:
+            raise FormatError('invalid bytecode')
+        return code
+
+    def read_const(self):
+        tag = self.read_char()
+        if tag == 'i':
+            return newint(self.read_int())
+        elif tag == 'l':
+            return newlong(long_from_decimal(self.read_str()))
+        elif tag == 's':
+            return Str(self.read_str())
+        elif tag == 'T':
+            return TRUE
+        elif tag == 'F':
+            return FALSE
+        elif tag == 'N':
+            return b_None
+        elif tag == 'C':
+            self.pos -= 1
+            return self.read_code()
+        raise FormatError('unknown constant tag')
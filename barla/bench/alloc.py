@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Allocation benchmark
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Counts the Int and Bool objects allocated while running programs, with
+    the canonical booleans and the small int cache enabled and disabled.
+
+    Needs a PyPy source checkout on the PYTHONPATH, like barla itself.
+
+    Usage: python bench/alloc.py [filename ...]
+"""
+
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from barla import Interpreter, compile, interpreter, objects
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), os.pardir, 'examples')
+COUNTED = [objects.Bool, objects.Int]
+# Modules the interpreter looks newbool and newint up in at run time
+PATCHED = [objects, interpreter]
+
+counts = dict.fromkeys(COUNTED, 0)
+
+
+def counting(cls):
+    init = cls.__init__
+    def __init__(self, *args, **kwargs):
+        counts[cls] += 1
+        init(self, *args, **kwargs)
+    cls.__init__ = __init__
+
+def uncached_newbool(value):
+    return objects.Bool(value)
+
+def uncached_newint(value):
+    return objects.Int(value)
+
+def run(filename, cached):
+    code = compile(filename, False)
+    if cached:
+        newbool, newint = objects.newbool, objects.newint
+    else:
+        newbool, newint = uncached_newbool, uncached_newint
+    saved = [(module.newbool, module.newint) for module in PATCHED]
+    for module in PATCHED:
+        module.newbool, module.newint = newbool, newint
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    counts.update(dict.fromkeys(COUNTED, 0))
+    try:
+        Interpreter().execute(code)
+    finally:
+        sys.stdout = stdout
+        for (module, (old_newbool, old_newint)) in zip(PATCHED, saved):
+            module.newbool, module.newint = old_newbool, old_newint
+    return [counts[cls] for cls in COUNTED]
+
+def main(args):
+    filenames = args or sorted(glob.glob(os.path.join(EXAMPLES, '*.bl')))
+    for cls in COUNTED:
+        counting(cls)
+    print '%-16s %6s %12s %12s %8s' % ('file', 'class', 'uncached',
+                                       'cached', 'saved')
+    for filename in filenames:
+        uncached = run(filename, False)
+        cached = run(filename, True)
+        for (cls, before, after) in zip(COUNTED, uncached, cached):
+            saved = 100.0 * (before - after) / before if before else 0.0
+            print '%-16s %6s %12d %12d %7.1f%%' % (
+                os.path.basename(filename), cls.__name__, before, after,
+                saved)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Arithmetic benchmark
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Runs pow.bl, mult.bl and fib.bl with and without the Int fast path in
+    the comparison opcodes and reports the timings targetbarla prints:
+    not jitted, jitted during warmup and warmed up. Arithmetic always
+    takes the fast path in Int.add, sub and mul.
+
+    By default the untranslated interpreter is run (this needs a PyPy
+    source checkout on the PYTHONPATH). Pass the path of a translated
+    barla executable to benchmark that one instead.
+
+    Usage: python bench/arith.py [executable]
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+PROGRAMS = ['pow.bl', 'mult.bl', 'fib.bl']
+TIMINGS = ['Non jitted', 'Warmup jitted', 'Warmed jitted']
+
+
+def run(command, filename, fast_path):
+    args = command + ['--no-dump', '--no-cache']
+    if not fast_path:
+        args.append('--no-int-fast-path')
+    output = subprocess.check_output(args + [filename])
+    timings = dict(re.findall(r'^(.*): ([\d.]+) seconds$', output, re.M))
+    return [float(timings[name]) for name in TIMINGS]
+
+def main(args):
+    if args:
+        command = [os.path.abspath(args[0])]
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'targetbarla.py')]
+    print '%-8s %-9s %12s %14s %14s' % ('file', 'fast path', 'not jitted',
+                                        'warmup jitted', 'warmed jitted')
+    for program in PROGRAMS:
+        filename = os.path.join(ROOT, 'examples', program)
+        for fast_path in [False, True]:
+            timings = run(command, filename, fast_path)
+            print '%-8s %-9s %12.4f %14.4f %14.4f' % (
+                program, 'on' if fast_path else 'off',
+                timings[0], timings[1], timings[2])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
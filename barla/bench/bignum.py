@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Bignum benchmark
+    ~~~~~~~~~~~~~~~~
+
+    Runs generated programs whose values overflow into Long: factorials,
+    powers, Fibonacci numbers and sums that grow and shrink back into a
+    machine word. Reports the run time and how many Long objects were
+    allocated, so temporary boxing of Ints shows up.
+
+    Needs a PyPy source checkout on the PYTHONPATH, like barla itself.
+
+    Usage: python bench/bignum.py [n ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from barla import Interpreter, compile_source, objects
+
+
+SIZES = [100, 1000, 3000]
+
+PROGRAMS = {
+    'fact': """\
+fact(n):
+    result := 1
+    while n > 1:
+        result := result * n
+        n := n - 1
+    .
+    return result
+.
+return fact(%(n)d)
+""",
+    'pow': """\
+pow(x, y):
+    a := 1
+    while y:
+        a := a * x
+        y := y - 1
+    .
+    return a
+.
+return pow(3, %(n)d)
+""",
+    'fib': """\
+a := 0
+b := 1
+i := %(n)d
+while i:
+    c := a + b
+    a := b
+    b := c
+    i := i - 1
+.
+return a
+""",
+    # Adds and subtracts a big number, so every other result fits into
+    # a machine word again
+    'seesaw': """\
+big := 1
+i := 100
+while i:
+    big := big * 1000
+    i := i - 1
+.
+s := 0
+i := %(n)d
+while i:
+    s := s + big
+    s := s - big + 1
+    i := i - 1
+.
+return s
+""",
+}
+
+allocated = [0]
+
+
+def count_longs():
+    init = objects.Long.__init__
+    def __init__(self, *args, **kwargs):
+        allocated[0] += 1
+        init(self, *args, **kwargs)
+    objects.Long.__init__ = __init__
+
+def run(source):
+    code = compile_source(source, False)
+    allocated[0] = 0
+    start = time.time()
+    result = Interpreter().execute(code)
+    stop = time.time()
+    return stop - start, allocated[0], result
+
+def main(args):
+    sizes = [int(arg) for arg in args] or SIZES
+    count_longs()
+    print '%-8s %8s %10s %10s %10s' % ('program', 'n', 'seconds', 'longs',
+                                       'digits')
+    for name in sorted(PROGRAMS):
+        for n in sizes:
+            (seconds, longs, result) = run(PROGRAMS[name] % {'n': n})
+            print '%-8s %8d %10.3f %10d %10d' % (
+                name, n, seconds, longs, len(result.str().flatten()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Constant pool benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compiles generated programs with more and more literals, once with the
+    interned constant pool and once with the old linear scan through the
+    constants, and reports the compile times and pool sizes. With interning
+    the time per literal stays flat as the programs grow.
+
+    Needs a PyPy source checkout on the PYTHONPATH, like barla itself.
+
+    Usage: python bench/consts.py [n ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from barla import compile_source
+from barla.assembler import Assembler
+
+
+SIZES = [2000, 4000, 8000, 16000]
+
+
+def literals(n):
+    """
+        A program with `n` statements, each loading an int and a string
+        literal. Half of the literals repeat earlier ones.
+    """
+    lines = ['s := 0', "t := ''"]
+    for i in xrange(n):
+        lines.append('s := %d' % (i % (n // 2), ))
+        lines.append("t := 'x%d'" % (i % (n // 2), ))
+    lines.append('return s')
+    return '\n'.join(lines)
+
+def scanning_add_const(self, obj):
+    try:
+        index = self.consts.index(obj)
+    except ValueError:
+        index = len(self.consts)
+        self.consts.append(obj)
+    return index
+
+def run(source, add_const):
+    saved = Assembler.add_const
+    Assembler.add_const = add_const
+    try:
+        start = time.time()
+        code = compile_source(source, False)
+        stop = time.time()
+    finally:
+        Assembler.add_const = saved
+    return stop - start, len(code.consts)
+
+def main(args):
+    sizes = [int(arg) for arg in args] or SIZES
+    print '%8s %10s %8s %10s %8s %12s' % (
+        'literals', 'scan', 'consts', 'interned', 'consts', 'us/literal')
+    for n in sizes:
+        source = literals(n)
+        (scan, scan_consts) = run(source, scanning_add_const)
+        (interned, consts) = run(source, Assembler.add_const)
+        print '%8d %10.3f %8d %10.3f %8d %12.2f' % (
+            2 * n, scan, scan_consts, interned, consts,
+            1e6 * interned / (2 * n))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
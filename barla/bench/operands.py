@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Wide operand check
+    ~~~~~~~~~~~~~~~~~~
+
+    Compiles and runs generated programs with tens of thousands of
+    constants and loop bodies far longer than 256 bytes, and checks their
+    results. These used to wrap around silently with one byte operands.
+
+    Needs a PyPy source checkout on the PYTHONPATH, like barla itself.
+
+    Usage: python bench/operands.py [n]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from barla import Interpreter, compile_source
+from barla.objects import Code
+
+
+def many_consts(n):
+    """
+        A function summing `n` distinct literals.
+    """
+    lines = ['sum():', '    s := 0']
+    lines.extend(['    s := s + %d' % (i, ) for i in xrange(n)])
+    lines.extend(['    return s', '.', 'return sum()'])
+    return '\n'.join(lines), n * (n - 1) // 2
+
+def long_loop(n):
+    """
+        A loop whose body is `n` statements long.
+    """
+    lines = ['i := 3', 's := 0', 'while i:']
+    lines.extend(['    s := s + %d' % (j % 7, ) for j in xrange(n)])
+    lines.extend(['    i := i - 1', '.', 'return s'])
+    return '\n'.join(lines), 3 * sum(j % 7 for j in xrange(n))
+
+def check(name, (source, expected)):
+    start = time.time()
+    code = compile_source(source, False)
+    result = Interpreter().execute(code).str().flatten()
+    stop = time.time()
+    # Report the biggest code object, which may be a function's
+    for const in code.consts:
+        if isinstance(const, Code) and len(const.code) > len(code.code):
+            code = const
+    status = 'ok' if result == str(expected) else 'FAILED (%s)' % (result, )
+    print '%-12s %8d bytes %8d consts %8.3f seconds  %s' % (
+        name, len(code.code), len(code.consts), stop - start, status)
+    return result == str(expected)
+
+def main(args):
+    n = int(args[0]) if args else 20000
+    ok = check('many consts', many_consts(n))
+    ok = check('long loop', long_loop(n)) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
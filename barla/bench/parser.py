@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Parser benchmark
+    ~~~~~~~~~~~~~~~~
+
+    Parses generated barla programs of increasing size with the packrat
+    memo table kept for the whole source, with the memo table dropped
+    after every top-level statement (as the compiler does), with plain
+    backtracking on offsets and with the engine barla had before packrat
+    parsing, which slices off the rest of the source after every token,
+    and reports parse time and peak memory. Every measurement runs in a
+    fresh process, so the peak memory of one run does not leak into the
+    next one.
+
+    The slicing engine is kept below, driving the grammar of
+    barla.parsing. It takes quadratic time, so it only parses programs of
+    up to SLICING_MAX_LINES lines.
+
+    Needs a PyPy source checkout on the PYTHONPATH, like barla itself.
+
+    Usage: python bench/parser.py [lines ...]
+"""
+
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from barla import parsing
+from barla.parsing import (ASTNode, ParseState, RePattern, WordNode,
+                           next_statement, statements)
+
+
+ENGINES = ['packrat', 'incremental', 'backtracking', 'slicing']
+SLICING_MAX_LINES = 25000
+SIZES = [10000, 25000, 50000, 100000]
+
+BLOCK = """\
+f%(n)d(x, y):
+    a := x
+    while y > 0:
+        if a > %(n)d:
+            if y == 1: a := a - 1.
+            else: a := a + y.
+        .
+        else: a := a * 2.
+        y := y - 1
+    .
+    if x > 0:
+        if y > 0:
+            if x > y:
+                if y > 1: a := a + 1.
+            .
+        .
+    .
+    return a
+.
+r%(n)d := f%(n)d(%(n)d, 3) + 1
+if r%(n)d != 0: print 'r%(n)d = ' + str(r%(n)d).
+"""
+BLOCK_LINES = BLOCK.count('\n')
+
+
+def generate(lines):
+    """
+        Returns a program with at least `lines` lines.
+    """
+    blocks = [BLOCK % {'n': n}
+              for n in xrange((lines + BLOCK_LINES - 1) // BLOCK_LINES)]
+    return ''.join(blocks)
+
+# The parser framework before packrat parsing: every parser gets the rest
+# of the source as a string and returns what remains after its match
+
+class SlicingResult(object):
+    def __init__(self, tree, rest):
+        self.tree = tree
+        self.rest = rest
+
+class SlicingRule(object):
+    def __init__(self, transformer):
+        self.parser = None
+        self.transformer = transformer
+
+    def match(self, string):
+        match = self.parser.match(string)
+        if match is not None and self.transformer is not None:
+            tree = self.transformer(match.tree)
+            if tree is None:
+                return None
+            match = SlicingResult(tree, match.rest)
+        return match
+
+def slicing_parserize(parsers):
+    return [SlicingWord(re.escape(parser)) if isinstance(parser, basestring)
+            else parser for parser in parsers]
+
+class SlicingWord(object):
+    def __init__(self, expr):
+        self.regex = RePattern('\s*(%s)' % (expr, ))
+
+    def match(self, string):
+        match = self.regex.match(string)
+        if match:
+            return SlicingResult(WordNode(match.group(1)),
+                                 string[match.end():])
+        return None
+
+class SlicingAny(object):
+    def __init__(self, *parsers):
+        self.parsers = slicing_parserize(parsers)
+
+    def match(self, string):
+        for parser in self.parsers:
+            match = parser.match(string)
+            if match is not None:
+                return match
+        return None
+
+class SlicingOpt(object):
+    def __init__(self, parser):
+        self.parser = parser
+
+    def match(self, string):
+        match = self.parser.match(string)
+        if match is not None:
+            return match
+        return SlicingResult(ASTNode(), string)
+
+class SlicingRep(object):
+    def __init__(self, parser):
+        self.parser = parser
+
+    def match(self, string):
+        result = ASTNode()
+        while True:
+            match = self.parser.match(string)
+            if match is None:
+                break
+            string = match.rest
+            result.children.append(match.tree)
+        return SlicingResult(result, string)
+
+class SlicingSeq(object):
+    def __init__(self, *parsers):
+        self.parsers = slicing_parserize(parsers)
+
+    def match(self, string):
+        result = ASTNode()
+        for parser in self.parsers:
+            match = parser.match(string)
+            if match is None:
+                return None
+            string = match.rest
+            result.children.append(match.tree)
+        return SlicingResult(result, string)
+
+def slicing_grammar():
+    """
+        Builds the rules of barla.parsing on the slicing framework and
+        returns them by name.
+    """
+    rules = {'Word': SlicingWord, 'Any': SlicingAny, 'Opt': SlicingOpt,
+             'Rep': SlicingRep, 'Seq': SlicingSeq}
+    names = [name for name in dir(parsing) if name.startswith('p_')]
+    for name in names:
+        rules[name[2:]] = SlicingRule(getattr(parsing, name))
+    for name in names:
+        rules[name[2:]].parser = eval(getattr(parsing, name).__doc__, rules)
+    return rules
+
+def child(engine, lines):
+    source = generate(lines)
+    if engine == 'slicing':
+        grammar = slicing_grammar()
+    start = time.time()
+    if engine == 'slicing':
+        rest = grammar['statements'].match(source).rest
+        pos = len(source) - len(rest)
+    elif engine == 'incremental':
+        state = ParseState(source)
+        pos = 0
+        result = next_statement(state, pos)
+        while result is not None:
+            pos = result.pos
+            result = next_statement(state, pos)
+    else:
+        state = ParseState(source, engine != 'backtracking')
+        pos = statements.parse(state, 0).pos
+    stop = time.time()
+    assert pos == len(source.rstrip())
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print '%f %d %d' % (stop - start, maxrss, len(source))
+
+def main(args):
+    if args and args[0] == '--child':
+        child(args[1], int(args[2]))
+        return
+    sizes = [int(arg) for arg in args] or SIZES
+    print '%-13s %8s %10s %10s %12s' % ('engine', 'lines', 'bytes',
+                                        'seconds', 'peak KiB')
+    for lines in sizes:
+        for engine in ENGINES:
+            if engine == 'slicing' and lines > SLICING_MAX_LINES:
+                print '%-13s %8d %10s %10s %12s' % (engine, lines, '-', '-',
+                                                    '-')
+                continue
+            output = subprocess.check_output([sys.executable, __file__,
+                                              '--child', engine, str(lines)])
+            seconds, maxrss, size = output.split()
+            print '%-13s %8d %10s %10.3f %12s' % (engine, lines, size,
+                                                  float(seconds), maxrss)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+    String benchmark
+    ~~~~~~~~~~~~~~~~
+
+    Runs generated programs that build long strings by repeated
+    concatenation, once with rope strings and once with every
+    concatenation copied right away, and reports the run times.
+
+    Needs a PyPy source checkout on the PYTHONPATH, like barla itself.
+
+    Usage: python bench/strings.py [n ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from barla import Interpreter, compile_source, objects
+
+
+SIZES = [1000, 10000, 50000]
+
+PROGRAMS = {
+    # Appending single characters to an accumulator
+    'append': """\
+s := ''
+i := %(n)d
+while i:
+    s := s + 'x'
+    i := i - 1
+.
+return s
+""",
+    # Appending numbers and separators, like building a report line
+    'join': """\
+s := ''
+i := %(n)d
+while i:
+    s := s + str(i) + ', '
+    i := i - 1
+.
+return s
+""",
+    # Prepending, which builds right-deep ropes
+    'prepend': """\
+s := ''
+i := %(n)d
+while i:
+    s := '<' + s + '>'
+    i := i - 1
+.
+return s
+""",
+}
+
+
+def run(source, ropes):
+    saved = objects.ROPE_MIN_LENGTH
+    if not ropes:
+        objects.ROPE_MIN_LENGTH = sys.maxint
+    try:
+        code = compile_source(source, False)
+        start = time.time()
+        result = Interpreter().execute(code).str().flatten()
+        stop = time.time()
+    finally:
+        objects.ROPE_MIN_LENGTH = saved
+    return stop - start, result
+
+def main(args):
+    sizes = [int(arg) for arg in args] or SIZES
+    print '%-8s %8s %10s %12s %12s' % ('program', 'n', 'length', 'copying',
+                                       'ropes')
+    for name in sorted(PROGRAMS):
+        for n in sizes:
+            source = PROGRAMS[name] % {'n': n}
+            (copying, expected) = run(source, False)
+            (ropes, result) = run(source, True)
+            assert result == expected
+            print '%-8s %8d %10d %12.3f %12.3f' % (name, n, len(result),
+                                                   copying, ropes)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 
 
+import os
 import time
 from pypy.jit.backend.hlinfo import highleveljitinfo
 from pypy.jit.metainterp.policy import JitPolicy
 
-from barla import Interpreter, compile
+from barla import BarlaNameError, BarlaSyntaxError, Interpreter, compile
+from barla.dis import dis
+from barla.jitstats import JitStats
+from barla.pool import run_code, run_programs
+from barla.profiler import Profiler
 
 
 def entry_point(args):
@@ -17,18 +22,111 @@ def entry_point(args):
     # viewcode.py to know the executable whose symbols it should display)
     highleveljitinfo.sys_executable = args[0]
 
-    if len(args) != 2:
-        print 'Usage: %s <filename>' % (args[0], )
-        return 1
+    ips = False
+    runs = 0
+    jobs = 0
+    profile = False
+    disassemble = False
+    jit_stats = False
+    optimize = True
+    dump = True
+    use_cache = True
+    int_fast_path = True
+    inline_caches = True
+    i = 1
+    while i < len(args) and args[i].startswith('--'):
+        if args[i] == '--ips':
+            ips = True
+        elif args[i] == '--batch' and i + 1 < len(args):
+            i += 1
+            try:
+                runs = int(args[i])
+            except ValueError:
+                return usage(args[0])
+            if runs <= 0:
+                return usage(args[0])
+        elif args[i] == '--jobs' and i + 1 < len(args):
+            i += 1
+            try:
+                jobs = int(args[i])
+            except ValueError:
+                return usage(args[0])
+            if jobs <= 0:
+                return usage(args[0])
+        elif args[i] == '--profile':
+            profile = True
+        elif args[i] == '--dis':
+            disassemble = True
+        elif args[i] == '--jit-stats':
+            jit_stats = True
+        elif args[i] == '--no-optimize':
+            optimize = False
+        elif args[i] == '--no-dump':
+            dump = False
+        elif args[i] == '--no-cache':
+            use_cache = False
+        elif args[i] == '--no-int-fast-path':
+            int_fast_path = False
+        elif args[i] == '--no-inline-caches':
+            inline_caches = False
+        else:
+            return usage(args[0])
+        i += 1
+    filenames = args[i:]
+
+    if jobs and filenames:
+        return run_parallel(find_programs(filenames), jobs, optimize,
+                            use_cache, int_fast_path, inline_caches)
+    if runs and filenames:
+        return run_batch(find_programs(filenames), runs, optimize, use_cache,
+                         int_fast_path, inline_caches)
+    if ips and filenames:
+        return measure_ips(filenames, optimize, use_cache, int_fast_path,
+                           inline_caches)
+    if len(filenames) != 1:
+        return usage(args[0])
+
+    try:
+        return run_file(filenames[0], profile, disassemble, jit_stats,
+                        optimize, dump, use_cache, int_fast_path,
+                        inline_caches)
+    except BarlaSyntaxError, e:
+        print 'Syntax error: %s' % (e.msg, )
+    except BarlaNameError, e:
+        print "Name error: name '%s' is not defined" % (e.name, )
+    return 1
 
-    code = compile(args[1])
+
+def run_file(filename, profile, disassemble, jit_stats, optimize, dump,
+             use_cache, int_fast_path, inline_caches):
+    """
+        Runs a single program without and with the JIT and prints the
+        times, or profiles or disassembles it.
+    """
+    code = compile(filename, dump, optimize, use_cache)
+    if disassemble:
+        dis(code)
+        return 0
     interpreter = Interpreter()
+    interpreter.int_fast_path = int_fast_path
+    interpreter.use_inline_caches = inline_caches
+
+    if profile:
+        profiler = Profiler()
+        interpreter.profiler = profiler
+        interpreter.execute(code, False)
+        interpreter.profiler = None
+        profiler.report()
+        return 0
 
     start = time.clock()
     interpreter.execute(code, False)
     stop = time.clock()
     print 'Non jitted: %f seconds' % (stop - start, )
 
+    if jit_stats:
+        interpreter.jit_stats = JitStats()
+
     start = time.clock()
     interpreter.execute(code, True)
     stop = time.clock()
@@ -39,6 +137,175 @@ def entry_point(args):
     stop = time.clock()
     print 'Warmed jitted: %f seconds' % (stop - start, )
 
+    if jit_stats:
+        interpreter.jit_stats.report()
+
+    return 0
+
+
+def usage(executable):
+    print 'Usage: %s [options] <filename>' % (executable, )
+    print '       %s --ips [options] <filename> ...' % (executable, )
+    print '       %s --batch <runs> [options] <filename|directory> ...' % (
+        executable, )
+    print '       %s --jobs <n> [options] <filename|directory> ...' % (
+        executable, )
+    print
+    print 'Options:'
+    print '  --ips          report instructions per second for each file'
+    print '  --batch <runs> run every file <runs> times in one interpreter and'
+    print '                 print min, median and p95 times as a table;'
+    print '                 directories stand for the .bl files in them'
+    print '  --jobs <n>     compile and run all files in <n> worker processes'
+    print '                 and print their output in order; directories'
+    print '                 stand for the .bl files in them'
+    print '  --profile      run once without the JIT and print a flat'
+    print '                 profile, opcode counts and a heat map per'
+    print '                 function'
+    print '  --dis          print the bytecode instead of running it'
+    print '  --jit-stats    report how often the jitted runs reached each'
+    print '                 loop header and recursive function entry from'
+    print '                 the interpreter and from compiled code'
+    print '  --no-optimize  disable the peephole optimizer'
+    print '  --no-cache     neither read nor write .blc bytecode caches'
+    print '  --no-dump      do not print the parse tree'
+    print '  --no-int-fast-path'
+    print '                 send all comparisons through the object methods'
+    print '  --no-inline-caches'
+    print '                 look up globals and check arities on every access'
+    return 1
+
+
+def measure_ips(filenames, optimize, use_cache, int_fast_path,
+                inline_caches):
+    """
+        Micro-benchmark mode: reports the executed instructions per second
+        for each file, without and with the JIT.
+    """
+    results = []
+    for filename in filenames:
+        code = compile(filename, False, optimize, use_cache)
+        # Count the instructions in a separate run, so the timed runs
+        # don't pay for counting
+        interpreter = Interpreter()
+        interpreter.int_fast_path = int_fast_path
+        interpreter.use_inline_caches = inline_caches
+        profiler = Profiler()
+        interpreter.profiler = profiler
+        interpreter.execute(code, False)
+        instructions = profiler.total_instructions()
+
+        interpreter = Interpreter()
+        interpreter.int_fast_path = int_fast_path
+        interpreter.use_inline_caches = inline_caches
+        start = time.clock()
+        interpreter.execute(code, False)
+        plain = time.clock() - start
+        # Warm up the JIT first
+        interpreter.execute(code, True)
+        start = time.clock()
+        interpreter.execute(code, True)
+        jitted = time.clock() - start
+        results.append('%-30s %12d %14.0f %14.0f' % (
+            filename, instructions, instructions / max(plain, 1e-9),
+            instructions / max(jitted, 1e-9)))
+
+    print '%-30s %12s %14s %14s' % ('file', 'instructions', 'ips',
+                                    'ips jitted')
+    for line in results:
+        print line
+    return 0
+
+
+def find_programs(paths):
+    """
+        Returns the files in `paths`, with directories replaced by the .bl
+        files in them.
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = [name for name in os.listdir(path)
+                     if name.endswith('.bl')]
+            names.sort()
+            for name in names:
+                filenames.append(os.path.join(path, name))
+        else:
+            filenames.append(path)
+    return filenames
+
+def percentile(times, percent):
+    """
+        Returns the `percent` percentile of the sorted list `times`, using
+        the nearest rank.
+    """
+    rank = (len(times) * percent + 99) // 100
+    return times[max(rank, 1) - 1]
+
+def run_batch(filenames, runs, optimize, use_cache, int_fast_path,
+              inline_caches):
+    """
+        Regression benchmark mode: compiles all files up front, then runs
+        each one `runs` times with the JIT in a single interpreter and
+        prints a tab separated table of the CPU times in seconds. PRINT
+        output is discarded. A program that fails gets its status instead
+        of the times, and the table goes on with the next one.
+    """
+    codes = []
+    statuses = []
+    for filename in filenames:
+        try:
+            codes.append(compile(filename, False, optimize, use_cache))
+            statuses.append('ok')
+        except OSError:
+            codes.append(None)
+            statuses.append('cannot read file')
+        except BarlaSyntaxError, e:
+            codes.append(None)
+            statuses.append('syntax error: %s' % (e.msg, ))
+    interpreter = Interpreter()
+    interpreter.int_fast_path = int_fast_path
+    interpreter.use_inline_caches = inline_caches
+    print 'file\truns\tmin\tmedian\tp95\tmax'
+    for i in xrange(len(filenames)):
+        times = []
+        status = statuses[i]
+        while status == 'ok' and len(times) < runs:
+            interpreter.reset_globals()
+            interpreter.output = []
+            start = time.clock()
+            status = run_code(interpreter, codes[i])
+            times.append(time.clock() - start)
+        interpreter.output = None
+        if status != 'ok':
+            print '%s\t%d\t%s' % (filenames[i], len(times), status)
+            continue
+        times.sort()
+        print '%s\t%d\t%f\t%f\t%f\t%f' % (
+            filenames[i], runs, times[0], percentile(times, 50),
+            percentile(times, 95), times[-1])
+    return 0
+
+
+def run_parallel(filenames, jobs, optimize, use_cache, int_fast_path,
+                 inline_caches):
+    """
+        CI mode: runs independent programs in parallel, then prints the
+        output of each one under a header line, in the order they were
+        given. Fails if any program failed.
+    """
+    results = run_programs(filenames, jobs, optimize, use_cache,
+                           int_fast_path, inline_caches)
+    failed = 0
+    for result in results:
+        print '==> %s: %s' % (result.filename, result.status)
+        for line in result.output:
+            print line
+        if result.status != 'ok':
+            failed += 1
+    if failed:
+        print '%d of %d programs failed' % (failed, len(results))
+        return 1
     return 0
 
 
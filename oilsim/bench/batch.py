@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Batch engine check
+    ~~~~~~~~~~~~~~~~~~
+
+    Plays every pairing of the deterministic strategies on a few parameter
+    sets (64 mixes) once with the scalar classes, round by round like
+    main(), and once as a single simulate_batch() call, and checks that
+    every recorded stat, the number of rounds and the outcome of each run
+    agree exactly.
+
+    Random strategies can't be compared with the scalar game, which uses
+    the random module, so the check plays Random against Random in a
+    batch and checks that the two players draw independently: they must
+    not always own the same number of pumps, and both must go bankrupt
+    first in some runs.
+
+    Usage: python bench/batch.py [rounds] [random runs]
+"""
+
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import numpy as np
+
+import oilsim
+from oilsim import (DEFAULT_PARAMS, STAT_NAMES, OUTCOMES, PLAYED, EMPTY,
+                    BANKRUPT1, BANKRUPT2, simulate_batch)
+
+
+STRATEGIES = [oilsim.MinmaxStrategy, oilsim.TakeBestStrategy,
+              oilsim.MaxallStrategy, oilsim.DoNothingStrategy]
+PARAMS = [
+    {},
+    {'pump_maintenance_cost': 10, 'demand': 5000, 'initial_money': 50000},
+    {'demand_slope': 0.5, 'pump_buy_price': 2000, 'pump_sell_price': 1500,
+     'tank_price': 100, 'tank_size': 500},
+    {'oil_source_size': 50000, 'initial_pumps': 3, 'demand': 800},
+]
+
+
+def play(strategy1, strategy2, params, rounds):
+    """ One game of main() with the scalar classes, returns the recorded
+    stats and the outcome. """
+    p = dict(DEFAULT_PARAMS)
+    p.update(params)
+    pm = oilsim.LogPumpModel(p['pump_buy_price'], p['pump_sell_price'],
+                             p['pump_maintenance_cost'], p['oil_source_size'],
+                             p['pump_output'], p['maintenance_price_factor'])
+    market = oilsim.Market(p['oil_source_size'],
+                           oilsim.SimpleOilPriceModel(p['oil_price_factor']), pm,
+                           oilsim.LinearDemandModel(p['demand'], p['demand_slope']),
+                           oilsim.ConstantStashModel(p['tank_price'], p['tank_size']))
+    player1 = strategy1(oilsim.OilProducer(p['initial_pumps'], p['initial_money'],
+                                           'Player 1', False))
+    player2 = strategy2(oilsim.OilProducer(p['initial_pumps'], p['initial_money'],
+                                           'Player 2', False))
+    market.update(0, 0, 0, (player1.pumps + player2.pumps) * market.pump_output)
+    player1.end_round(0, 0)
+    player2.end_round(0, 0)
+
+    stats = defaultdict(list)
+    for rnum in xrange(rounds):
+        pm = oilsim.PayoffMatrix(market, player1, player2)
+        player1.begin_round()
+        player2.begin_round()
+        p1d = player1.decide(pm, market)
+        p2d = player2.decide(pm, market)
+        for d in p1d:
+            if player1.perform(d, market):
+                break
+        for d in p2d:
+            if player2.perform(d, market):
+                break
+
+        p1r, p1s, p1p, p2r, p2s, p2p, p1st, p2st = market.revenue(player1, player2)
+        player1.end_round(p1r, p1s, p1st)
+        player2.end_round(p2r, p2s, p2st)
+        if not market.update(rnum + 1, player1.pumps + player2.pumps, p1s + p2s,
+                             p1p + p2p + player1.stash + player2.stash):
+            return stats, EMPTY
+        if player1.money < 0:
+            return stats, BANKRUPT1
+        if player2.money < 0:
+            return stats, BANKRUPT2
+
+        for k, v in (('player1pumps', player1.pumps), ('player2pumps', player2.pumps),
+                     ('player1sold', p1s), ('player2sold', p2s),
+                     ('player1potential', p1p), ('player2potential', p2p),
+                     ('player1revenue', p1r), ('player2revenue', p2r),
+                     ('player1money', player1.money), ('player2money', player2.money),
+                     ('oilprice', market.oil_price), ('oildemand', market.demand),
+                     ('player1stash', player1.stash), ('player2stash', player2.stash),
+                     ('oilsource', market.total_oil),
+                     ('pumpmaintcost', market.pump_maintenance_cost)):
+            stats[k].append(v)
+    return stats, PLAYED
+
+
+def check_deterministic(rounds):
+    mixes = [(s1, s2, i) for s1 in STRATEGIES for s2 in STRATEGIES
+             for i in xrange(len(PARAMS))]
+    start = time.time()
+    expected = [play(s1, s2, PARAMS[i], rounds) for s1, s2, i in mixes]
+    scalar_time = time.time() - start
+
+    names = set(k for params in PARAMS for k in params)
+    params = dict((k, np.array([PARAMS[i].get(k, DEFAULT_PARAMS[k]) for _, _, i in mixes],
+                               float))
+                  for k in names)
+    start = time.time()
+    result = simulate_batch(len(mixes), [s1 for s1, _, _ in mixes],
+                            [s2 for _, s2, _ in mixes], params, rounds=rounds)
+    batch_time = time.time() - start
+
+    failed = 0
+    for run, ((s1, s2, i), (stats, outcome)) in enumerate(zip(mixes, expected)):
+        played = len(stats['oilprice'])
+        errors = []
+        if result.rounds[run] != played:
+            errors.append('%d rounds instead of %d' % (result.rounds[run], played))
+        if result.outcome[run] != outcome:
+            errors.append('%r instead of %r' % (OUTCOMES[result.outcome[run]],
+                                                OUTCOMES[outcome]))
+        for k in STAT_NAMES:
+            got = result.stats[k][:played, run]
+            differ = np.flatnonzero(np.array(stats[k], float)[:len(got)] != got[:played])
+            if len(differ):
+                errors.append('%s differs from round %d' % (k, differ[0]))
+        if errors:
+            failed += 1
+            print '%s vs %s, parameters %d: %s' % (s1.__name__, s2.__name__, i,
+                                                   ', '.join(errors))
+    print '%d mixes, %d rounds: %d mismatches (scalar %.2f s, batch %.2f s)' % (
+        len(mixes), rounds, failed, scalar_time, batch_time)
+    return not failed
+
+
+def check_random(rounds, runs):
+    result = simulate_batch(runs, oilsim.RandomStrategy, oilsim.RandomStrategy,
+                            rounds=rounds, record=('player1pumps', 'player2pumps'))
+    pumps1 = result.stats['player1pumps']
+    pumps2 = result.stats['player2pumps']
+    recorded = ~np.isnan(pumps1)
+    differ = (pumps1 != pumps2) & recorded
+    outcomes = np.bincount(result.outcome, minlength=len(OUTCOMES))
+    print 'random vs random, %d runs: pumps differ in %d of %d rounds' % (
+        runs, differ.sum(), recorded.sum())
+    for outcome, count in zip(OUTCOMES, outcomes):
+        print '%6d runs: %s' % (count, outcome)
+    ok = differ.any() and outcomes[BANKRUPT1] and outcomes[BANKRUPT2]
+    if not ok:
+        print 'the players do not draw independently'
+    return ok
+
+
+def main(args):
+    rounds = int(args[0]) if args else 2000
+    runs = int(args[1]) if len(args) > 1 else 200
+    ok = check_deterministic(rounds)
+    ok = check_random(300, runs) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
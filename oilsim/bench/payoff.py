@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Payoff check
+    ~~~~~~~~~~~~
+
+    Market.revenue() and market_revenue() implement the same algorithm,
+    once on scalars for single games and once on arrays for batches. This
+    check takes markets from scalar games with several parameter sets and
+    strategies, gives the players a range of pumps and stashes in each,
+    and checks that payoff_table() computes exactly the payoffs
+    PayoffMatrix has for every one of these states.
+
+    Usage: python bench/payoff.py [rounds]
+"""
+
+import copy
+import itertools
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import numpy as np
+
+import oilsim
+from oilsim import BatchMarket, DEFAULT_PARAMS, make_models, payoff_table
+
+
+STRATEGIES = [(oilsim.MinmaxStrategy, oilsim.MinmaxStrategy),
+              (oilsim.TakeBestStrategy, oilsim.MaxallStrategy),
+              (oilsim.RandomStrategy, oilsim.MinmaxStrategy),
+              (oilsim.RandomStrategy, oilsim.RandomStrategy)]
+PARAMS = [
+    {},
+    {'pump_maintenance_cost': 10, 'demand': 5000, 'initial_money': 50000},
+    {'demand_slope': 0.5, 'pump_buy_price': 2000, 'pump_sell_price': 1500,
+     'tank_price': 100, 'tank_size': 500},
+    {'oil_source_size': 50000, 'initial_pumps': 3, 'demand': 800},
+]
+ACTIONS = 'B0S'
+# The pumps and stashes each player is given in every collected market
+PUMPS = (0, 1, 2, 10, 40)
+STASHES = (0, 35.5, 800)
+
+
+def collect(strategy1, strategy2, params, rounds, every=250):
+    """ Plays a game of main() and returns copies of its market every
+    `every` rounds. """
+    p = dict(DEFAULT_PARAMS)
+    p.update(params)
+    pm = oilsim.LogPumpModel(p['pump_buy_price'], p['pump_sell_price'],
+                             p['pump_maintenance_cost'], p['oil_source_size'],
+                             p['pump_output'], p['maintenance_price_factor'])
+    market = oilsim.Market(p['oil_source_size'],
+                           oilsim.SimpleOilPriceModel(p['oil_price_factor']), pm,
+                           oilsim.LinearDemandModel(p['demand'], p['demand_slope']),
+                           oilsim.ConstantStashModel(p['tank_price'], p['tank_size']))
+    player1 = strategy1(oilsim.OilProducer(p['initial_pumps'], p['initial_money'],
+                                           'Player 1', False))
+    player2 = strategy2(oilsim.OilProducer(p['initial_pumps'], p['initial_money'],
+                                           'Player 2', False))
+    market.update(0, 0, 0, (player1.pumps + player2.pumps) * market.pump_output)
+
+    markets = []
+    for rnum in xrange(rounds):
+        if rnum % every == 0:
+            markets.append(copy.deepcopy(market))
+        pm = oilsim.PayoffMatrix(market, player1, player2)
+        player1.begin_round()
+        player2.begin_round()
+        p1d = player1.decide(pm, market)
+        p2d = player2.decide(pm, market)
+        for d in p1d:
+            if player1.perform(d, market):
+                break
+        for d in p2d:
+            if player2.perform(d, market):
+                break
+        p1r, p1s, p1p, p2r, p2s, p2p, p1st, p2st = market.revenue(player1, player2)
+        player1.end_round(p1r, p1s, p1st)
+        player2.end_round(p2r, p2s, p2st)
+        if (not market.update(rnum + 1, player1.pumps + player2.pumps, p1s + p2s,
+                              p1p + p2p + player1.stash + player2.stash) or
+                player1.money < 0 or player2.money < 0):
+            break
+    return markets
+
+
+def producer(pumps, stash, name):
+    producer = oilsim.OilProducer(pumps, 0, name, False)
+    producer.stash = stash
+    return producer
+
+
+def check(params, markets):
+    """ Computes the payoff tables of every market with every combination
+    of PUMPS and STASHES in one batch, and compares them to PayoffMatrix.
+    Returns the number of states whose payoffs differ. """
+    states = [(market, pumps, stash)
+              for market in markets
+              for pumps in itertools.product(PUMPS, PUMPS)
+              for stash in itertools.product(STASHES, STASHES)]
+    runs = len(states)
+    p, opm, pm, dm, sm = make_models(params, runs)
+    batch = BatchMarket(runs, p['oil_source_size'], opm, pm, dm, sm)
+    batch.oil_price = np.array([m.oil_price for m, _, _ in states], float)
+    batch.demand = np.array([m.demand for m, _, _ in states], float)
+    batch.pump_maintenance_cost = np.array([m.pump_maintenance_cost for m, _, _ in states],
+                                           float)
+    table = payoff_table(batch,
+                         np.array([pumps[0] for _, pumps, _ in states]),
+                         np.array([pumps[1] for _, pumps, _ in states]),
+                         np.array([stash[0] for _, _, stash in states], float),
+                         np.array([stash[1] for _, _, stash in states], float))
+
+    failed = 0
+    for run, (market, pumps, stash) in enumerate(states):
+        pm = oilsim.PayoffMatrix(market, producer(pumps[0], stash[0], 'Player 1'),
+                                 producer(pumps[1], stash[1], 'Player 2')).pm
+        expected = np.array([[pm[a1 + a2] for a2 in ACTIONS] for a1 in ACTIONS])
+        got = table[:, :, :, run].transpose(1, 2, 0)
+        if not np.array_equal(expected, got):
+            failed += 1
+            print 'price %g, demand %g, pumps %s, stash %s: payoffs differ by up to %g' % (
+                market.oil_price, market.demand, pumps, stash, abs(expected - got).max())
+    return runs, failed
+
+
+def main(args):
+    rounds = int(args[0]) if args else 2000
+    # RandomStrategy uses the random module
+    random.seed(0)
+    total = failed = 0
+    for params in PARAMS:
+        markets = []
+        for strategy1, strategy2 in STRATEGIES:
+            markets.extend(collect(strategy1, strategy2, params, rounds))
+        runs, mismatches = check(params, markets)
+        total += runs
+        failed += mismatches
+    print '%d states, %d mismatches' % (total, failed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -4,12 +4,18 @@ from __future__ import division, with_statement
 
 from collections import defaultdict
 from math import cos, sin, pi, log, ceil
+from optparse import OptionParser
 
+import csv
+import itertools
+import multiprocessing
 import random
 import os
 import os.path
 import sys
 
+import numpy as np
+
 def _flatten(lol):
     for i in lol:
         if isinstance(i, (tuple, list)):
@@ -27,42 +33,15 @@ class PayoffMatrix(object):
         self.player1 = player1
         self.player2 = player2
 
-        self.pm = {'BB': 0, 'B0': 0, 'BS': 0,
-                   '0B': 0, '00': 0, '0S': 0,
-                   'SB': 0, 'S0': 0, 'SS': 0}
-
-        supply = market.supply
-        demand = market.demand
-
-        # revenue, oil sold, potential
-        p1r, p1s, p1p, p2r, p2s, p2p, p1st, p2st = market.revenue(player1, player2)
-        self.pm['00'] = (p1r, p2r)
-        p1r = 0
-        p2r = 0
-        
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, -1, -1)
-        self.pm['SS'] = (p1rt - p1r + market.pump_sell_price, p2rt - p2r + market.pump_sell_price)
-
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, -1, 0)
-        self.pm['S0'] = (p1rt - p1r + market.pump_sell_price, p2rt - p2r)
-        
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, -1, 1)
-        self.pm['SB'] = (p1rt - p1r + market.pump_sell_price, p2rt - p2r - market.pump_buy_price)
-
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, 0, -1)
-        self.pm['0S'] = (p1rt - p1r, p2rt - p2r + market.pump_sell_price)
-
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, 0, 1)
-        self.pm['0B'] = (p1rt - p1r, p2rt - p2r - market.pump_buy_price)
-
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, 1, -1)
-        self.pm['BS'] = (p1rt - p1r - market.pump_buy_price , p2rt - p2r + market.pump_sell_price)
-
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, 1, 0)
-        self.pm['B0'] = (p1rt - p1r - market.pump_buy_price, p2rt - p2r)
-        
-        p1rt, p1s, p1p, p2rt, ps2, p2p, p1st, p2st = market.revenue(player1, player2, 1, 1)
-        self.pm['BB'] = (p1rt - p1r - market.pump_buy_price, p2rt - p2r - market.pump_buy_price)
+        # Market.revenue() doesn't touch the models, so the cells can be
+        # computed in any order. Scalar code is faster than payoff_table()
+        # for a single game.
+        self.pm = {}
+        costs = (market.pump_buy_price, 0, -market.pump_sell_price)
+        for a1, d1, c1 in zip('B0S', DELTAS, costs):
+            for a2, d2, c2 in zip('B0S', DELTAS, costs):
+                r = market.revenue(player1, player2, d1, d2)
+                self.pm[a1 + a2] = (r[0] - c1, r[3] - c2)
 
     def __str__(self):
         str = "   |                      B |                      0 |                      S \n" \
@@ -86,7 +65,7 @@ class PayoffMatrix(object):
         return {'B': self.sum(player, 'B'), '0': self.sum(player, '0'), 'S': self.sum(player, 'S')}
 
 class OilProducer(object):
-    def __init__(self, initialpumps, initialmoney, name=None):
+    def __init__(self, initialpumps, initialmoney, name=None, verbose=True):
         self.pumps = initialpumps
         self.money = initialmoney
         self.oldmoney = initialmoney
@@ -97,25 +76,30 @@ class OilProducer(object):
         else:
             self.name = name
         self.dpumps = 0
+        self.verbose = verbose
+
+    def say(self, message):
+        if self.verbose:
+            print message
 
     def buy_pump(self, market):
-        print '%s buys a pump.' % self.name
+        self.say('%s buys a pump.' % self.name)
         if self.money >= market.pump_buy_price:
             self.dpumps += 1
             self.money -= market.pump_buy_price
             return True
         else:
-            print '... but cannot afford it'
+            self.say('... but cannot afford it')
             return False
 
     def sell_pump(self, market):
-        print '%s sells a pump.' % self.name
+        self.say('%s sells a pump.' % self.name)
         if self.pumps > 0:
             self.dpumps -= 1
             self.money += market.pump_sell_price
             return True
         else:
-            print "... but doesn't own any pumps."
+            self.say("... but doesn't own any pumps.")
             return False
 
     def begin_round(self):
@@ -287,10 +271,22 @@ class SimpleOilPriceModel(object):
         self.factor = factor
 
     def update(self, round, demand, act_supply, supply):
+        self.price = self.price_for(demand, supply)
+
+    def price_for(self, demand, supply):
+        """ The price for `demand` and `supply`, without setting it. """
         try:
-            self.price = min(self.factor * demand / supply, self.factor / 0.05)
+            return min(self.factor * demand / supply, self.factor / 0.05)
         except ZeroDivisionError:
-            self.price = self.factor / 0.05
+            return self.factor / 0.05
+
+    def batch_price(self, demand, supply):
+        """ The price `update` sets, for arrays of demands and supplies. """
+        cap = self.factor / 0.05
+        nonzero = supply != 0
+        return np.where(nonzero,
+                        np.minimum(self.factor * demand / np.where(nonzero, supply, 1), cap),
+                        cap)
 
 class ConstantDemandModel(object):
     def __init__(self, demand=200):
@@ -317,6 +313,10 @@ class LinearDemandModel(object):
     def update(self, round, *args):
         self.demand = self.k * round + self.d
 
+    def batch_demand(self, round):
+        """ The demand `update` sets, for arrays of parameters. """
+        return self.k * round + self.d
+
 class ConstantPumpModel(object):
     def __init__(self, buy_price, sell_price, maintenance_cost, output):
         self.buy_price = buy_price
@@ -332,13 +332,19 @@ class LogPumpModel(object):
         self.buy_price = buy_price
         self.sell_price = sell_price
         self.smc = start_maintenance_cost
-        self.sto = pricefac*log(total_oil)
+        # math.log keeps a single game in plain floats, which are much
+        # faster than NumPy scalars
+        self.sto = pricefac*(log(total_oil) if np.isscalar(total_oil) else np.log(total_oil))
         self.output = output
         self.pricefac = pricefac
 
     def update(self, round, demand, supply, potential, total_oil):
         self.maintenance_cost = -self.pricefac*log(total_oil) + self.smc + self.sto
 
+    def batch_maintenance_cost(self, total_oil):
+        """ The maintenance cost `update` sets, for an array of source sizes. """
+        return -self.pricefac*np.log(total_oil) + self.smc + self.sto
+
 class ConstantStashModel(object):
     def __init__(self, tank_price, tank_size):
         self.size = tank_size
@@ -347,6 +353,9 @@ class ConstantStashModel(object):
     def price(self, stash):
         return ceil(stash / self.size) * self.tank_price
 
+    def batch_price(self, stash):
+        return np.ceil(stash / self.size) * self.tank_price
+
 class Market(object):
     def __init__(self, total_oil, oil_model, pump_model, demand_model, stash_model):
         self.total_oil = total_oil
@@ -424,16 +433,75 @@ class Market(object):
         stash1 = max(0, stash1 + p1o - p1s)
         stash2 = max(0, stash2 + p2o - p2s)
 
-        # revene of both players
+        # revene of both players, at the price the changed supply would
+        # have (without setting it)
+        price = self.oil_price
         if pd1 != 0 or pd2 != 0:
-            self.oil_model.update(self.round + 1, self.demand, p1s + p2s, p1o + p2o + stash1 + stash2)
+            price = self.oil_model.price_for(self.demand, p1o + p2o + stash1 + stash2)
 
-        p1r = self.oil_price * p1s - self.pump_maintenance_cost * pumpsp1 - self.stash_model.price(stash1)
-        p2r = self.oil_price * p2s - self.pump_maintenance_cost * pumpsp2 - self.stash_model.price(stash2)
+        p1r = price * p1s - self.pump_maintenance_cost * pumpsp1 - self.stash_model.price(stash1)
+        p2r = price * p2s - self.pump_maintenance_cost * pumpsp2 - self.stash_model.price(stash2)
 
-        self.oil_model.update(self.round, self.demand, self.act_supply, self.supply)
         return (p1r, p1s, p1o, p2r, p2s, p2o, stash1, stash2)
 
+""" actions, in the order of the payoff matrix rows """
+BUY, NOTHING, SELL = 0, 1, 2
+""" pump deltas of the actions """
+DELTAS = (1, 0, -1)
+
+def market_revenue(market, pumps1, pumps2, stash1, stash2, pd1=0, pd2=0):
+    """ Market.revenue() for the arrays of pumps and stashes of a
+    BatchMarket. The pump deltas may be arrays as well. """
+    pumpsp1 = np.maximum(pumps1 + pd1, 0)
+    pumpsp2 = np.maximum(pumps2 + pd2, 0)
+
+    # calculate the relative sizes, runs without oil get zeros
+    total = pumpsp1 + pumpsp2 + stash1 + stash2
+    p1s = (pumpsp1 + stash1) / np.where(total == 0, 1, total)
+    p2s = 1 - p1s
+
+    # oil produced per player
+    p1o = pumpsp1 * market.pump_output
+    p2o = pumpsp2 * market.pump_output
+
+    # amount of sold oil (total and per player)
+    oilsold = np.minimum(p1o + p2o + stash1 + stash2, market.demand)
+    p1s = p1s * oilsold
+    p2s = p2s * oilsold
+
+    # hand what a player cannot deliver to the other one
+    over1 = p1s > p1o + stash1
+    over2 = ~over1 & (p2s > p2o + stash2)
+    d1 = p1s - p1o - stash1
+    d2 = p2s - p2o - stash2
+    p1s, p2s = (np.where(over1, p1o + stash1,
+                         np.where(over2, np.minimum(p1s + d2, p1o + stash1), p1s)),
+                np.where(over1, np.minimum(p2s + d1, p2o + stash2),
+                         np.where(over2, p2o + stash2, p2s)))
+
+    stash1 = np.maximum(0, stash1 + p1o - p1s)
+    stash2 = np.maximum(0, stash2 + p2o - p2s)
+
+    price = np.where((np.asarray(pd1) != 0) | (np.asarray(pd2) != 0),
+                     market.oil_model.batch_price(market.demand, p1o + p2o + stash1 + stash2),
+                     market.oil_price)
+    p1r = price * p1s - market.pump_maintenance_cost * pumpsp1 - market.stash_model.batch_price(stash1)
+    p2r = price * p2s - market.pump_maintenance_cost * pumpsp2 - market.stash_model.batch_price(stash2)
+    return (p1r, p1s, p1o, p2r, p2s, p2o, stash1, stash2)
+
+def payoff_table(market, pumps1, pumps2, stash1, stash2):
+    """ The payoffs of both players for all nine combinations of actions,
+    in a single pass over the runs of a BatchMarket. Returns an array
+    indexed by the player, the actions of player 1 and 2 (see BUY, NOTHING
+    and SELL) and the run. PayoffMatrix computes the same for one game;
+    bench/payoff.py checks that the two agree. """
+    shape = (1, ) * np.ndim(pumps1)
+    pd1 = np.reshape(DELTAS, (3, 1) + shape)
+    pd2 = np.reshape(DELTAS, (1, 3) + shape)
+    p1r, _, _, p2r, _, _, _, _ = market_revenue(market, pumps1, pumps2, stash1, stash2, pd1, pd2)
+    costs = np.array(np.broadcast_arrays(-market.pump_buy_price, 0, market.pump_sell_price))
+    return np.array([p1r + costs[:, np.newaxis], p2r + costs[np.newaxis]])
+
 class PlayerStat(object):
     def __init__(self, name, money, moneydiff, pumps, supply, potential=0):
         self.name = name
@@ -469,6 +537,26 @@ class RoundStat(object):
 def print_mat(n, m, f=sys.stdout):
       f.write("%s = %s;\n" % (n, str(m).replace('[', '{').replace(']', '}')))
 
+def write_stats(filename, rstats):
+    """ Writes the per-round stats: a NumPy .npz archive with one array per
+    stat, a CSV file with one column per stat or, for any other
+    extension, Mathematica definitions. """
+    if os.path.exists(filename):
+        s = os.stat(filename)
+        root, ext = os.path.splitext(filename)
+        os.rename(filename, '%s.%d%s' % (root, s.st_mtime, ext))
+    ext = os.path.splitext(filename)[1]
+    if ext == '.npz':
+        np.savez(filename, **rstats)
+    elif ext == '.csv':
+        names = [k for k in STAT_NAMES if k in rstats]
+        np.savetxt(filename, np.column_stack([rstats[k] for k in names]),
+                   fmt='%.17g', delimiter=',', header=','.join(names), comments='')
+    else:
+        with open(filename, 'w') as f:
+            for k, v in rstats.iteritems():
+                print_mat(k, v.tolist() if isinstance(v, np.ndarray) else v, f)
+
 """ price of a new pump """
 PUMP_BUY_PRICE = 10000
 """ value of an pump """
@@ -481,30 +569,53 @@ ROUNDS = 10000 # 1000*12
 PUMP_MAINTENANCE_COST = 100
 OIL_SOURCE_SIZE = 1000000
 
-def main():
+""" types of the per-round stats in quiet mode, float if not listed """
+STAT_TYPES = {'player1pumps': np.int32, 'player2pumps': np.int32}
+
+def main(args=[]):
+    parser = OptionParser(usage='%prog [options]\n       %prog sweep [options]',
+                          description='Plays one game and writes the stats of all rounds.')
+    parser.add_option('-q', '--quiet', action='store_true', default=False,
+                      help="don't print every round, keep the stats in arrays")
+    parser.add_option('-s', '--summary', type='int', default=0, metavar='N',
+                      help='print a one line summary every N rounds')
+    parser.add_option('-o', '--output', metavar='FILE',
+                      help='.npz (NumPy arrays), .csv or anything else '
+                      '(Mathematica) [data.npz if quiet, else data.txt]')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments')
+    verbose = not options.quiet
+    output = options.output or ('data.txt' if verbose else 'data.npz')
+
     opm = SimpleOilPriceModel(1)
     # pm = ConstantPumpModel(PUMP_BUY_PRICE, PUMP_SELL_PRICE, PUMP_MAINTENANCE_COST, PUMP_OUTPUT)
     pm = LogPumpModel(PUMP_BUY_PRICE, PUMP_SELL_PRICE, PUMP_MAINTENANCE_COST, OIL_SOURCE_SIZE, PUMP_OUTPUT, 200)
     # market = Market(OIL_SOURCE_SIZE, opm, pm, LinearDemandModel(2000,0), ConstantStashModel(PUMP_BUY_PRICE/10, 10*PUMP_BUY_PRICE))
     market = Market(OIL_SOURCE_SIZE, opm, pm, LinearDemandModel(2000,0), ConstantStashModel(PUMP_BUY_PRICE/10, 10*PUMP_BUY_PRICE))
 
-    producer1 = OilProducer(10, 10000, 'Player 1')
-    producer2 = OilProducer(10, 10000, 'Player 2')
+    producer1 = OilProducer(10, 10000, 'Player 1', verbose)
+    producer2 = OilProducer(10, 10000, 'Player 2', verbose)
     player1 = MinmaxStrategy(producer1) # RandomStrategy(producer1)
     player2 = MinmaxStrategy(producer2) # RandomStrategy(producer2)
     market.update(0, 0, 0, (player1.pumps + player2.pumps) * market.pump_output) # we need to start with some inital value
 
-    rstats = defaultdict(list) 
+    if verbose:
+        rstats = defaultdict(list)
+    else:
+        rstats = dict((k, np.zeros(ROUNDS, STAT_TYPES.get(k, float))) for k in STAT_NAMES)
+    played = 0
     stats = {-1: RoundStat(-1, market.oil_price, market.demand, 0, 0,
                            (player1.end_round(0, 0), player2.end_round(0, 0)), OIL_SOURCE_SIZE)}
-    print stats[-1]
+    if verbose:
+        print stats[-1]
 
     for rnum in xrange(ROUNDS):
-        print 'in round %d' % rnum
-        
         pm = PayoffMatrix(market, player1, player2)
-        print 'payoff matrix:'
-        print str(pm)
+        if verbose:
+            print 'in round %d' % rnum
+            print 'payoff matrix:'
+            print str(pm)
 
         player1.begin_round()
         player2.begin_round()
@@ -536,38 +647,497 @@ def main():
             print "player 2 went bankrupt"
             break
 
-        rstats['player1pumps'].append(player1.pumps)
-        rstats['player2pumps'].append(player2.pumps)
-        rstats['player1sold'].append(p1s)
-        rstats['player2sold'].append(p2s)
-        rstats['player1potential'].append(p1p)
-        rstats['player2potential'].append(p2p)
-        rstats['player1revenue'].append(p1r)
-        rstats['player2revenue'].append(p2r)
-        rstats['player1money'].append(player1.money)
-        rstats['player2money'].append(player2.money)
-        rstats['oilprice'].append(market.oil_price)
-        rstats['oildemand'].append(market.demand)
-        rstats['player1stash'].append(player1.stash)
-        rstats['player2stash'].append(player2.stash)
-        rstats['oilsource'].append(market.total_oil)
-        rstats['pumpmaintcost'].append(market.pump_maintenance_cost)
-
-        stats.update({rnum: RoundStat(rnum, market.oil_price, market.demand,
-                                      market.supply, p1p + p2p, stat, market.total_oil)})
-        print stats[rnum]
-        print
-
-    if os.path.exists('data.txt'):
-        s = os.stat('data.txt')
-        os.rename('data.txt', 'data.%d.txt' % s.st_mtime)
-    with open('data.txt', 'w') as f:
-        for k, v in rstats.iteritems():
-            print_mat(k, v, f)
+        for k, v in (('player1pumps', player1.pumps), ('player2pumps', player2.pumps),
+                     ('player1sold', p1s), ('player2sold', p2s),
+                     ('player1potential', p1p), ('player2potential', p2p),
+                     ('player1revenue', p1r), ('player2revenue', p2r),
+                     ('player1money', player1.money), ('player2money', player2.money),
+                     ('oilprice', market.oil_price), ('oildemand', market.demand),
+                     ('player1stash', player1.stash), ('player2stash', player2.stash),
+                     ('oilsource', market.total_oil),
+                     ('pumpmaintcost', market.pump_maintenance_cost)):
+            if verbose:
+                rstats[k].append(v)
+            else:
+                rstats[k][rnum] = v
+        played = rnum + 1
+
+        if verbose:
+            stats.update({rnum: RoundStat(rnum, market.oil_price, market.demand,
+                                          market.supply, p1p + p2p, stat, market.total_oil)})
+            print stats[rnum]
+            print
+        if options.summary and played % options.summary == 0:
+            print 'round %5d: price %8.2f, demand %8.2f, source %10.2f | ' \
+                '%s: %12.2f money, %3d pumps | %s: %12.2f money, %3d pumps' % (
+                    rnum, market.oil_price, market.demand, market.total_oil,
+                    player1.name, player1.money, player1.pumps,
+                    player2.name, player2.money, player2.pumps)
+
+    if not verbose:
+        rstats = dict((k, v[:played]) for k, v in rstats.iteritems())
+    write_stats(output, rstats)
+
+# Batch simulation: many independent games at once, one array entry per run
+
+""" the preference orders strategies return, as action indexes """
+ORDER_NAMES = ('B0S', 'BS0', '0BS', '0SB', 'SB0', 'S0B')
+ORDER_CODES = dict((name, i) for i, name in enumerate(ORDER_NAMES))
+ORDERS = np.array([['B0S'.index(a) for a in name] for name in ORDER_NAMES])
+
+""" names of the recorded per-round stats, as in main() """
+STAT_NAMES = ('player1pumps', 'player2pumps', 'player1sold', 'player2sold',
+              'player1potential', 'player2potential', 'player1revenue',
+              'player2revenue', 'player1money', 'player2money', 'oilprice',
+              'oildemand', 'player1stash', 'player2stash', 'oilsource',
+              'pumpmaintcost')
+
+""" why a run ended """
+PLAYED, EMPTY, BANKRUPT1, BANKRUPT2 = range(4)
+OUTCOMES = ('played all rounds', 'oil source is empty',
+            'player 1 went bankrupt', 'player 2 went bankrupt')
+
+""" the parameters of main(), see make_models() """
+DEFAULT_PARAMS = {
+    'oil_price_factor': 1,
+    'pump_buy_price': PUMP_BUY_PRICE,
+    'pump_sell_price': PUMP_SELL_PRICE,
+    'pump_maintenance_cost': PUMP_MAINTENANCE_COST,
+    'pump_output': PUMP_OUTPUT,
+    'maintenance_price_factor': 200,
+    'oil_source_size': OIL_SOURCE_SIZE,
+    'demand': 2000,
+    'demand_slope': 0,
+    'tank_price': PUMP_BUY_PRICE / 10,
+    'tank_size': 10 * PUMP_BUY_PRICE,
+    'initial_pumps': 10,
+    'initial_money': 10000,
+}
+
+def make_models(params, runs):
+    """ Creates the models of main() from `params`, whose values are
+    scalars or arrays with one entry per run. Missing parameters are
+    taken from DEFAULT_PARAMS. """
+    p = dict(DEFAULT_PARAMS)
+    p.update(params or {})
+    p = dict((k, np.zeros(runs) + v) for k, v in p.iteritems())
+    opm = SimpleOilPriceModel(p['oil_price_factor'])
+    pm = LogPumpModel(p['pump_buy_price'], p['pump_sell_price'],
+                      p['pump_maintenance_cost'], p['oil_source_size'],
+                      p['pump_output'], p['maintenance_price_factor'])
+    dm = LinearDemandModel(p['demand'], p['demand_slope'])
+    sm = ConstantStashModel(p['tank_price'], p['tank_size'])
+    return p, opm, pm, dm, sm
+
+class BatchMarket(object):
+    """ The array counterpart of Market: `runs` independent markets whose
+    models have array parameters. """
+    def __init__(self, runs, total_oil, oil_model, pump_model, demand_model, stash_model):
+        self.total_oil = np.zeros(runs) + total_oil
+        self.oil_model = oil_model
+        self.pump_model = pump_model
+        self.demand_model = demand_model
+        self.stash_model = stash_model
+
+    def start(self, supply):
+        """ Market.update() in round 0. """
+        self.demand = self.demand_model.batch_demand(0) + np.zeros_like(self.total_oil)
+        self.oil_price = self.oil_model.batch_price(self.demand, supply)
+        self.pump_maintenance_cost = self.pump_model.batch_maintenance_cost(self.total_oil)
+
+    def update(self, round, totalpumps, supply, active):
+        """ Market.update() for the `active` runs. Returns which of them
+        still have oil. """
+        self.total_oil = np.where(active, self.total_oil - totalpumps * self.pump_output,
+                                  self.total_oil)
+        ok = active & (self.total_oil > 0)
+        self.demand = np.where(ok, self.demand_model.batch_demand(round), self.demand)
+        self.oil_price = np.where(ok, self.oil_model.batch_price(self.demand, supply),
+                                  self.oil_price)
+        self.pump_maintenance_cost = np.where(
+            ok, self.pump_model.batch_maintenance_cost(self.total_oil),
+            self.pump_maintenance_cost)
+        return ok
+
+    pump_buy_price = property(lambda self: self.pump_model.buy_price)
+    pump_sell_price = property(lambda self: self.pump_model.sell_price)
+    pump_output = property(lambda self: self.pump_model.output)
+
+def _max3(a, b, c):
+    return np.maximum(np.maximum(a, b), c)
+
+def _select(conditions, orders, default):
+    return np.select(conditions, [ORDER_CODES[o] for o in orders], ORDER_CODES[default])
+
+def batch_random(own, other, can_buy, can_sell, rand):
+    return (rand % np.uint64(len(ORDER_NAMES))).astype(int)
+
+def batch_take_best(own, other, can_buy, can_sell, rand):
+    """ TakeBestStrategy.decide() for all runs. """
+    b = np.where(can_buy, own[BUY].max(axis=0), -np.inf)
+    z = own[NOTHING].max(axis=0)
+    s = np.where(can_sell, own[SELL].max(axis=0), -np.inf)
+    m = _max3(b, z, s)
+    return _select([(m == b) & (np.maximum(z, s) == z), m == b,
+                    (m == s) & (np.maximum(b, z) == b), m == s],
+                   ['B0S', 'BS0', 'SB0', 'S0B'], '0BS')
+
+def batch_minmax(own, other, can_buy, can_sell, rand):
+    """ MinmaxStrategy.decide() for all runs. """
+    b = np.where(can_buy, own[BUY].min(axis=0), -np.inf)
+    bm = own[BUY].max(axis=0)
+    z = own[NOTHING].min(axis=0)
+    zm = own[NOTHING].max(axis=0)
+    s = np.where(can_sell, own[SELL].min(axis=0), -np.inf)
+    sm = own[SELL].max(axis=0)
+
+    m = _max3(b, z, s)
+    mm = _max3(bm, zm, sm)
+    tie = (b == z) & (z == s)
+    return _select([tie & (bm == zm) & (zm == sm),
+                    tie & (mm == bm) & (np.maximum(zm, sm) == zm),
+                    tie & (mm == bm),
+                    tie & (mm == zm),
+                    tie & (np.maximum(zm, bm) == zm),
+                    tie,
+                    (m == z) & (m == s) & (np.maximum(zm, sm) == zm),
+                    (m == z) & (m == s),
+                    (m == b) & (m == s) & (np.maximum(bm, sm) == bm),
+                    (m == b) & (m == s),
+                    (m == b) & (m == z) & (np.maximum(bm, zm) == bm),
+                    (m == b) & (m == z),
+                    (m == b) & (np.maximum(s, z) == z),
+                    m == b,
+                    (m == s) & (np.maximum(b, z) == z),
+                    m == s],
+                   ['B0S', 'B0S', 'BS0', '0BS', 'S0B', 'SB0',
+                    '0SB', 'S0B', 'BS0', 'SB0', 'B0S', '0BS',
+                    'B0S', 'BS0', 'S0B', 'SB0'], '0BS')
+
+def batch_maxall(own, other, can_buy, can_sell, rand):
+    """ MaxallStrategy.decide() for all runs. """
+    joint = own + other
+    bm = np.where(can_buy, joint[BUY].max(axis=0), -np.inf)
+    zm = joint[NOTHING].max(axis=0)
+    sm = np.where(can_sell, joint[SELL].max(axis=0), -np.inf)
+    m = _max3(bm, zm, sm)
+    # MaxallStrategy returns 'OBS' in the last case, which does nothing
+    # just like '0BS'
+    return _select([(m == bm) & (np.maximum(zm, sm) == zm), m == bm,
+                    (m == sm) & (np.maximum(bm, zm) == bm), m == sm],
+                   ['B0S', 'BS0', 'SB0', 'S0B'], '0BS')
+
+def batch_do_nothing(own, other, can_buy, can_sell, rand):
+    return np.zeros(len(can_buy), int) + ORDER_CODES['0BS']
+
+""" the batch version of each strategy's decide() """
+BATCH_STRATEGIES = {
+    RandomStrategy: batch_random,
+    TakeBestStrategy: batch_take_best,
+    MinmaxStrategy: batch_minmax,
+    MaxallStrategy: batch_maxall,
+    DoNothingStrategy: batch_do_nothing,
+}
+
+def _random_bits(seeds, n):
+    """ Pseudo random numbers depending only on the seed of a run and the
+    draw number `n` (SplitMix64), so a run plays the same whatever batch it
+    is in. """
+    z = seeds + np.full(seeds.shape, n + 1, np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _strategy_masks(strategies, runs):
+    """ Returns (strategy class, runs using it) pairs. `strategies` is a
+    strategy class or one class per run. """
+    if isinstance(strategies, type):
+        return [(strategies, np.ones(runs, bool))]
+    return [(strategy, np.array([s is strategy for s in strategies]))
+            for strategy in set(strategies)]
+
+def _decide(masks, own, other, can_buy, can_sell, rand):
+    """ Returns the preference orders of all runs. """
+    orders = np.zeros(len(can_buy), int)
+    for strategy, mask in masks:
+        orders = np.where(mask, BATCH_STRATEGIES[strategy](own, other, can_buy, can_sell, rand),
+                          orders)
+    return orders
+
+def _perform(orders, can_buy, can_sell):
+    """ The action each run performs: the first one it can afford in its
+    preference order, like Strategy.perform(). """
+    actions = ORDERS[orders]
+    runs = np.arange(len(orders))
+    possible = np.array([can_buy, np.ones_like(can_buy), can_sell])
+    return np.where(possible[actions[:, 0], runs], actions[:, 0],
+                    np.where(possible[actions[:, 1], runs], actions[:, 1], actions[:, 2]))
+
+class BatchResult(object):
+    def __init__(self, seeds, stats, last, total, rounds, outcome):
+        self.seeds = seeds
+        # stat name -> array of the recorded rounds (rows) of every run
+        # (columns), NaN after the run ended
+        self.stats = stats
+        # stat name -> its value in the last round each run played (NaN
+        # if none) and its sum over all of them
+        self.last = last
+        self.total = total
+        # number of rounds each run played
+        self.rounds = rounds
+        # why each run ended, an index into OUTCOMES
+        self.outcome = outcome
+
+def simulate_batch(runs, strategy1=MinmaxStrategy, strategy2=MinmaxStrategy,
+                   params=None, seeds=None, rounds=ROUNDS, record=STAT_NAMES, every=1):
+    """ Plays `runs` independent games of main() at once, advancing all
+    of them one round at a time. `strategy1` and `strategy2` are strategy
+    classes, or sequences with one class per run; `params` may override
+    DEFAULT_PARAMS with scalars or arrays with one entry per run. Records
+    the stats named in `record` every `every` rounds, or only their last
+    value and sum if `every` is None, and returns a BatchResult. """
+    p, opm, pm, dm, sm = make_models(params, runs)
+    market = BatchMarket(runs, p['oil_source_size'], opm, pm, dm, sm)
+    if seeds is None:
+        seeds = np.arange(runs)
+    seeds = np.asarray(seeds, dtype=np.uint64)
+    strategy1 = _strategy_masks(strategy1, runs)
+    strategy2 = _strategy_masks(strategy2, runs)
+
+    pumps1 = p['initial_pumps'].astype(int)
+    pumps2 = pumps1.copy()
+    dpumps1 = np.zeros(runs, int)
+    dpumps2 = np.zeros(runs, int)
+    money1 = p['initial_money'].copy()
+    money2 = money1.copy()
+    stash1 = np.zeros(runs)
+    stash2 = np.zeros(runs)
+    market.start((pumps1 + pumps2) * market.pump_output)
+
+    stats = dict((k, np.full(((rounds + every - 1) // every, runs), np.nan))
+                 for k in (record if every else ()))
+    last = dict((k, np.full(runs, np.nan)) for k in record)
+    total = dict((k, np.zeros(runs)) for k in record)
+    played = np.zeros(runs, int)
+    outcome = np.zeros(runs, int)
+    active = np.ones(runs, bool)
+
+    # finished runs are still computed (and their results thrown away), so
+    # they may divide by zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for rnum in xrange(rounds):
+            table = payoff_table(market, pumps1, pumps2, stash1, stash2)
+
+            pumps1 = np.where(active, pumps1 + dpumps1, pumps1)
+            pumps2 = np.where(active, pumps2 + dpumps2, pumps2)
+
+            actions = []
+            for player, (strategy, own, other, pumps, money) in enumerate((
+                    (strategy1, table[0], table[1], pumps1, money1),
+                    (strategy2, table[1].transpose(1, 0, 2),
+                     table[0].transpose(1, 0, 2), pumps2, money2))):
+                # a stream per player, or random players would mirror each other
+                rand = _random_bits(seeds, 2 * rnum + player)
+                can_buy = money >= market.pump_buy_price
+                can_sell = pumps > 0
+                orders = _decide(strategy, own, other, can_buy, can_sell, rand)
+                actions.append(_perform(orders, can_buy, can_sell))
+            buy1, sell1 = active & (actions[0] == BUY), active & (actions[0] == SELL)
+            buy2, sell2 = active & (actions[1] == BUY), active & (actions[1] == SELL)
+            dpumps1 = np.where(active, buy1.astype(int) - sell1, dpumps1)
+            dpumps2 = np.where(active, buy2.astype(int) - sell2, dpumps2)
+            money1 = money1 - np.where(buy1, market.pump_buy_price, 0) + np.where(sell1, market.pump_sell_price, 0)
+            money2 = money2 - np.where(buy2, market.pump_buy_price, 0) + np.where(sell2, market.pump_sell_price, 0)
+
+            # revenue, oil sold, potential
+            p1r, p1s, p1p, p2r, p2s, p2p, p1st, p2st = market_revenue(market, pumps1, pumps2, stash1, stash2)
+            money1 = np.where(active, money1 + p1r, money1)
+            money2 = np.where(active, money2 + p2r, money2)
+            stash1 = np.where(active, p1st, stash1)
+            stash2 = np.where(active, p2st, stash2)
+
+            ok = market.update(rnum + 1, pumps1 + pumps2, p1p + p2p + stash1 + stash2, active)
+            outcome = np.select([active & ~ok, ok & (money1 < 0), ok & (money2 < 0)],
+                                [EMPTY, BANKRUPT1, BANKRUPT2], outcome)
+            active = ok & (money1 >= 0) & (money2 >= 0)
+            if not active.any():
+                break
+            played += active
+
+            recorded = every and rnum % every == 0
+            for k, v in (('player1pumps', pumps1), ('player2pumps', pumps2),
+                         ('player1sold', p1s), ('player2sold', p2s),
+                         ('player1potential', p1p), ('player2potential', p2p),
+                         ('player1revenue', p1r), ('player2revenue', p2r),
+                         ('player1money', money1), ('player2money', money2),
+                         ('oilprice', market.oil_price), ('oildemand', market.demand),
+                         ('player1stash', stash1), ('player2stash', stash2),
+                         ('oilsource', market.total_oil),
+                         ('pumpmaintcost', market.pump_maintenance_cost)):
+                if k in last:
+                    last[k] = np.where(active, v, last[k])
+                    total[k] += np.where(active, v, 0)
+                    if recorded:
+                        stats[k][rnum // every] = np.where(active, v, np.nan)
+
+    return BatchResult(seeds, stats, last, total, played, outcome)
+
+# Parameter sweeps: batch simulations of many parameter sets and strategy
+# pairings in a pool of worker processes
+
+""" strategies by their command line names """
+STRATEGIES = {
+    'random': RandomStrategy,
+    'takebest': TakeBestStrategy,
+    'minmax': MinmaxStrategy,
+    'maxall': MaxallStrategy,
+    'nothing': DoNothingStrategy,
+}
+
+""" the stats the summary of a run is computed from """
+SUMMARY_STATS = ('player1money', 'player2money', 'player1pumps',
+                 'player2pumps', 'oilsource', 'oilprice')
+
+def param_grid(values):
+    """ All combinations of `values`, which maps parameter names to lists
+    of values. """
+    names = sorted(values)
+    return [dict(zip(names, combo))
+            for combo in itertools.product(*[values[k] for k in names])]
+
+def param_sample(ranges, n, seed=0):
+    """ `n` parameter sets, each parameter drawn uniformly from the (low,
+    high) pair `ranges` maps it to. """
+    rng = np.random.RandomState(seed)
+    names = sorted(ranges)
+    draws = [rng.uniform(ranges[k][0], ranges[k][1], n) for k in names]
+    return [dict((k, float(d[i])) for k, d in zip(names, draws)) for i in xrange(n)]
+
+def _sweep_chunk(task):
+    """ Plays a chunk of a sweep as one batch, returns its summary rows. """
+    start, seed, runs, rounds = task
+    names = set(k for point, _ in runs for k in point)
+    params = dict((k, np.array([point.get(k, DEFAULT_PARAMS[k]) for point, _ in runs], float))
+                  for k in names)
+    result = simulate_batch(len(runs), [s1 for _, (s1, s2) in runs],
+                            [s2 for _, (s1, s2) in runs], params,
+                            seeds=seed + np.arange(start, start + len(runs)),
+                            rounds=rounds, record=SUMMARY_STATS, every=None)
+    rows = []
+    for i, (point, (s1, s2)) in enumerate(runs):
+        row = dict(point)
+        row.update({'run': start + i, 'seed': int(result.seeds[i]),
+                    'strategy1': s1.__name__, 'strategy2': s2.__name__,
+                    'rounds': int(result.rounds[i]),
+                    'outcome': OUTCOMES[result.outcome[i]]})
+        for k in SUMMARY_STATS[:-1]:
+            row[k] = float(result.last[k][i])
+        row['meanoilprice'] = float(result.total['oilprice'][i] / result.rounds[i]) \
+            if result.rounds[i] else float('nan')
+        rows.append(row)
+    return rows
+
+def sweep(points, pairings, repeats=1, rounds=ROUNDS, seed=0, processes=None,
+          chunksize=None):
+    """ Plays the game of main() for every parameter set in `points` (dicts
+    overriding DEFAULT_PARAMS) with every pair of strategy classes in
+    `pairings`, `repeats` times each. The runs are split into chunks of
+    `chunksize` which are played as batches in `processes` worker
+    processes (default: one per core).
+
+    Yields a summary row (a dict) per run, in the order of the runs. Run i
+    is seeded with `seed + i`, so the results don't depend on the number
+    of processes or the chunk size. """
+    runs = [(point, pairing) for point in points for pairing in pairings
+            for _ in xrange(repeats)]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunksize is None:
+        # a few chunks per process to even out the load, but bounded to
+        # keep the arrays of a batch small
+        chunksize = max(1, min(100, -(-len(runs) // (4 * processes))))
+    tasks = [(start, seed, runs[start:start + chunksize], rounds)
+             for start in xrange(0, len(runs), chunksize)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        for rows in pool.imap(_sweep_chunk, tasks):
+            for row in rows:
+                yield row
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _parse_assignment(parser, option, value, parse):
+    name, sep, spec = value.partition('=')
+    if not sep or name not in DEFAULT_PARAMS:
+        parser.error('%s: unknown parameter or missing value: %s' % (option, value))
+    try:
+        return name, parse(spec)
+    except ValueError:
+        parser.error('%s: invalid values: %s' % (option, value))
+
+def _parse_range(spec):
+    low, high = [float(x) for x in spec.split(':')]
+    return low, high
+
+def sweep_main(args):
+    parser = OptionParser(usage='%prog sweep [options]',
+                          description='Plays the game for a grid or random sample '
+                          'of parameters and strategy pairings and writes a CSV '
+                          'table with one row per run. Parameters: ' +
+                          ', '.join(sorted(DEFAULT_PARAMS)))
+    parser.add_option('-g', '--grid', action='append', default=[], metavar='NAME=V1,V2,...',
+                      help='values of a parameter, all combinations are played')
+    parser.add_option('-u', '--uniform', action='append', default=[], metavar='NAME=LOW:HIGH',
+                      help='sample a parameter uniformly, see --samples')
+    parser.add_option('-n', '--samples', type='int', default=10,
+                      help='number of random parameter sets [%default]')
+    parser.add_option('-s', '--strategies', action='append', default=[], metavar='S1:S2',
+                      help='a strategy pairing, out of: ' + ', '.join(sorted(STRATEGIES)) +
+                      ' [minmax:minmax]')
+    parser.add_option('-r', '--repeats', type='int', default=1,
+                      help='runs per parameter set and pairing [%default]')
+    parser.add_option('--rounds', type='int', default=ROUNDS, help='[%default]')
+    parser.add_option('--seed', type='int', default=0, help='[%default]')
+    parser.add_option('-j', '--processes', type='int', help='[number of cores]')
+    parser.add_option('-o', '--output', default='sweep.csv', help='[%default]')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments')
+
+    grid = dict(_parse_assignment(parser, '--grid', v,
+                                  lambda s: [float(x) for x in s.split(',')])
+                for v in options.grid)
+    ranges = dict(_parse_assignment(parser, '--uniform', v, _parse_range)
+                  for v in options.uniform)
+    samples = param_sample(ranges, options.samples, options.seed) if ranges else [{}]
+    points = [dict(g, **s) for g in param_grid(grid) for s in samples]
+    try:
+        pairings = [tuple(STRATEGIES[name] for name in pairing.split(':'))
+                    for pairing in options.strategies or ['minmax:minmax']]
+    except KeyError, e:
+        parser.error('unknown strategy %s' % e)
+
+    columns = (['run', 'seed', 'strategy1', 'strategy2'] + sorted(set(grid) | set(ranges)) +
+               ['rounds', 'outcome'] + list(SUMMARY_STATS[:-1]) + ['meanoilprice'])
+    outcomes = defaultdict(int)
+    with open(options.output, 'wb') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writerow(dict(zip(columns, columns)))
+        for row in sweep(points, pairings, options.repeats, options.rounds,
+                         options.seed, options.processes):
+            writer.writerow(row)
+            outcomes[row['outcome']] += 1
+    for outcome, count in sorted(outcomes.iteritems()):
+        print '%6d runs: %s' % (count, outcome)
 
 if __name__ == "__main__":
     try:
-        main()
+        if sys.argv[1:2] == ['sweep']:
+            sweep_main(sys.argv[2:])
+        else:
+            main(sys.argv[1:])
     except KeyboardInterrupt:
         pass
 